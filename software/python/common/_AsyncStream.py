@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import time
+import queue
+import threading
+import traceback
+import contextlib
+import concurrent.futures
+
+import rogue
+import pyrogue as pr
+
+from common._SlaveMonitor import SlaveMonitor
+
+#################################################################
+
+class FrameCopy(object):
+    # Copy of a rogue frame payload. Implements the part of the rogue Frame
+    # interface used by the readers (lock, getPayload, read, getChannel, ...),
+    # so their _acceptFrame() can be called with it unchanged. Picklable.
+    def __init__(self, data, channel=0, flags=0, error=0, rxTime=0.0):
+        self.data   = data
+        self.rxTime = rxTime
+        self._channel = channel
+        self._flags   = flags
+        self._error   = error
+
+    @classmethod
+    def fromFrame(cls, frame):
+        with frame.lock():
+            data = bytearray(frame.getPayload())
+            frame.read(data, 0)
+            return cls(data, frame.getChannel(), frame.getFlags(), frame.getError(), time.time())
+
+    def lock(self):
+        return contextlib.nullcontext()
+
+    def getPayload(self):
+        return len(self.data)
+
+    def getChannel(self):
+        return self._channel
+
+    def getFlags(self):
+        return self._flags
+
+    def getError(self):
+        return self._error
+
+    def read(self, buffer, offset=0):
+        # Fill buffer (bytearray or contiguous numpy array) from the payload at offset
+        view = memoryview(buffer).cast('B')
+        view[:] = self.data[offset:offset+len(view)]
+
+#################################################################
+
+AsyncCounters = [
+    'FrameCount',     # frames received
+    'SkipCount',      # frames not copied because the target had no consumer
+    'DropCount',      # frames dropped because the queue was full
+    'ProcessCount',   # frames processed
+    'ErrorCount',     # frames whose processing raised an exception
+    'MaxDepth',       # largest queue depth seen
+]
+
+class AsyncSlave(SlaveMonitor, rogue.interfaces.stream.Slave):
+    '''
+    Decouples a stream consumer from the rogue receive thread. Each frame is copied
+    into a FrameCopy and put in a bounded queue of queueSize frames; a pool of workers
+    takes them out and processes them. When the queue is full, frames are dropped and
+    counted, or with block=True the receive thread waits for room (lossless, the stream
+    is back-pressured instead). Frames are not copied while target.active is False
+    (e.g. an EventDecoder without subscribers).
+
+    target is either a rogue Slave, whose _acceptFrame() is called with the FrameCopy,
+    or a function(FrameCopy). The target is not connected to the stream itself:
+        display = feb.onlineEventDisplay(...)
+        pr.streamTap(top.dataStream[0], feb.AsyncSlave(display))
+
+    mode:
+        'thread'  : workers threads call the target (readers with a FrameDecoder are
+                    not thread safe, keep workers=1 for those)
+        'process' : workers processes call target, which must be a picklable module
+                    level function; its return value is passed to callback(result)
+                    in this process
+    With more than one worker the frames are no longer processed in order.
+    '''
+    def __init__(self, target, workers=1, queueSize=100, mode='thread', callback=None, block=False):
+        rogue.interfaces.stream.Slave.__init__(self)
+        if mode not in ['thread', 'process']:
+            raise ValueError(f'mode must be either [thread,process], got {mode}')
+        self.target   = target._acceptFrame if isinstance(target, rogue.interfaces.stream.Slave) else target
+        self.source   = target
+        self.block    = block
+        self.workers  = workers
+        self.mode     = mode
+        self.callback = callback
+        self._queue   = queue.Queue(maxsize=queueSize)
+        self._lock    = threading.Lock()
+        self.resetCounters()
+
+        self._running  = True
+        self._executor = None
+        if mode == 'thread':
+            self._threads = [threading.Thread(target=self._workLoop, daemon=True) for i in range(workers)]
+        else:
+            # Keep at most two frames per process in flight, the rest waits in the queue
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            self._inFlight = threading.BoundedSemaphore(2*workers)
+            self._threads  = [threading.Thread(target=self._dispatchLoop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def resetCounters(self):
+        with self._lock:
+            self.counters   = {name: 0 for name in AsyncCounters}
+            self._latSum    = 0.0
+            self.latencyMax = 0.0
+
+    @property
+    def queueDepth(self):
+        return self._queue.qsize()
+
+    @property
+    def latencyMean(self):
+        # Mean time from reception to the end of processing, in seconds
+        with self._lock:
+            n = self.counters['ProcessCount'] + self.counters['ErrorCount']
+            return self._latSum/n if n > 0 else 0.0
+
+    def _acceptFrame(self, frame):
+        if not getattr(self.source, 'active', True):
+            with self._lock:
+                self.counters['FrameCount'] += 1
+                self.counters['SkipCount']  += 1
+            return
+        frameCopy = FrameCopy.fromFrame(frame)
+        with self._lock:
+            self.counters['FrameCount'] += 1
+        if self.block:
+            self._queue.put(frameCopy)
+        else:
+            try:
+                self._queue.put_nowait(frameCopy)
+            except queue.Full:
+                with self._lock:
+                    self.counters['DropCount'] += 1
+                return
+        with self._lock:
+            self.counters['MaxDepth'] = max(self.counters['MaxDepth'], self._queue.qsize())
+
+    def _done(self, frameCopy, error):
+        latency = time.time() - frameCopy.rxTime
+        with self._lock:
+            self.counters['ErrorCount' if error else 'ProcessCount'] += 1
+            self._latSum   += latency
+            self.latencyMax = max(self.latencyMax, latency)
+
+    def _next(self):
+        # Next frame, or None once stopped and the queue is empty
+        while self._running or not self._queue.empty():
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def _workLoop(self):
+        while True:
+            frameCopy = self._next()
+            if frameCopy is None:
+                return
+            try:
+                result = self.target(frameCopy)
+                if self.callback is not None:
+                    self.callback(result)
+                self._done(frameCopy, False)
+            except Exception:
+                traceback.print_exc()
+                self._done(frameCopy, True)
+
+    def _dispatchLoop(self):
+        while True:
+            frameCopy = self._next()
+            if frameCopy is None:
+                return
+            self._inFlight.acquire()
+            future = self._executor.submit(self.target, frameCopy)
+            future.add_done_callback(lambda future, frameCopy=frameCopy: self._collect(future, frameCopy))
+
+    def _collect(self, future, frameCopy):
+        try:
+            result = future.result()
+            if self.callback is not None:
+                self.callback(result)
+            self._done(frameCopy, False)
+        except Exception:
+            traceback.print_exc()
+            self._done(frameCopy, True)
+        finally:
+            self._inFlight.release()
+
+    def stop(self):
+        # Process what is still queued and stop the workers
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+#################################################################
+
+class AsyncStream(pr.Device):
+    '''
+    AsyncSlave with its queue depth, drops and latency as variables. Tap the
+    slave into a data stream:
+        pr.streamTap(top.dataStream[i], device.slave)
+    '''
+    def __init__(self,
+            target,
+            name        = 'AsyncStream',
+            description = 'Asynchronous stream consumer',
+            workers     = 1,
+            queueSize   = 100,
+            mode        = 'thread',
+            callback    = None,
+            block       = False,
+            **kwargs):
+
+        super().__init__(
+            name        = name,
+            description = description,
+            **kwargs)
+
+        self.slave = AsyncSlave(target, workers, queueSize, mode, callback, block)
+        self.slave.monitorName = f'{name}.AsyncSlave'
+
+        self.add(pr.LocalVariable(
+            name         = 'QueueDepth',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: self.slave.queueDepth,
+            pollInterval = 1,
+        ))
+
+        for counter in AsyncCounters:
+            self.add(pr.LocalVariable(
+                name         = counter,
+                mode         = 'RO',
+                value        = 0,
+                localGet     = lambda counter=counter: self.slave.counters[counter],
+                pollInterval = 1,
+            ))
+
+        self.add(pr.LocalVariable(
+            name         = 'LatencyMean',
+            description  = 'Mean time from reception to the end of processing',
+            mode         = 'RO',
+            value        = 0.0,
+            units        = 'ms',
+            disp         = '{:.3f}',
+            localGet     = lambda: 1000*self.slave.latencyMean,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'LatencyMax',
+            mode         = 'RO',
+            value        = 0.0,
+            units        = 'ms',
+            disp         = '{:.3f}',
+            localGet     = lambda: 1000*self.slave.latencyMax,
+            pollInterval = 1,
+        ))
+
+        @self.command(description='Reset the counters')
+        def CountReset():
+            self.slave.resetCounters()
+
+    def stop(self):
+        self.slave.stop()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import numpy as np
+
+from common._HitFilter import HitSelect
+
+#################################################################
+
+# Output columns: (header name, source, printf format)
+CsvColumns = [
+    ('Timestamp',   'Timestamp',   '0x%016X'),
+    ('SeqCnt',      'SeqCnt',      '%d'),
+    ('TrigCnt',     'TrigCnt',     '%d'),
+    ('DropTrigCnt', 'dropTrigCnt', '%d'),
+    ('pixIndex',    'PixelIndex',  '%d'),
+    ('TotOverflow', 'TotOverflow', '%d'),
+    ('TotData',     'TotData',     '%d'),
+    ('ToaOverflow', 'ToaOverflow', '%d'),
+    ('ToaData',     'ToaData',     '%d'),
+    ('Hit',         'Hit',         '%d'),
+    ('Sof',         'Sof',         '%d'),
+]
+
+# Per-frame columns, the others come from the pixel array
+CsvFrameColumns = ['Timestamp', 'SeqCnt', 'TrigCnt', 'dropTrigCnt']
+
+class CsvExporter(object):
+    '''
+    Writes one row per pixel data word, with one file per channel
+    ({prefix}{channel}.csv or .tsv) opened the first time the channel is seen.
+    Rows are formatted a block at a time with a single string format instead
+    of a csv.writer call per row. Only the data words selected by hitFilter (HitFilter)
+    are written; hitsOnly is a shortcut for hitFilter=HitSelect (drop Hit == 0).
+    '''
+    def __init__(self, prefix='fpga', delimiter=',', hitsOnly=False, extension=None, blockRows=65536, bufferSize=1<<20, hitFilter=None):
+        self.prefix     = prefix
+        self.delimiter  = delimiter
+        self.hitFilter  = hitFilter if hitFilter is not None else (HitSelect if hitsOnly else None)
+        self.extension  = extension if extension is not None else ('csv' if delimiter == ',' else 'tsv')
+        self.blockRows  = blockRows
+        self.bufferSize = bufferSize
+        self.rowCount   = 0
+        self._files     = {}
+        self._rowFmt    = delimiter.join([fmt for _, _, fmt in CsvColumns]) + '\n'
+
+    def _file(self, channel):
+        if channel not in self._files:
+            f = open(f'{self.prefix}{channel}.{self.extension}', 'w', buffering=self.bufferSize)
+            f.write(self.delimiter.join([name for name, _, _ in CsvColumns]) + '\n')
+            self._files[channel] = f
+        return self._files[channel]
+
+    def _write(self, channel, columns):
+        # columns: list of equal length arrays in CsvColumns order
+        table = np.stack([np.asarray(c, dtype=np.uint64) for c in columns], axis=1)
+        f = self._file(channel)
+        for start in range(0, len(table), self.blockRows):
+            block = table[start:start+self.blockRows]
+            f.write((self._rowFmt * len(block)) % tuple(block.ravel().tolist()))
+        self.rowCount += len(table)
+
+    def writeEvent(self, channel, eventFrame):
+        # Single decoded frame (EventValue) from a stream slave
+        pix  = eventFrame.pixArray
+        sel  = self.hitFilter.mask(pix) if self.hitFilter is not None else slice(None)
+        nPix = len(pix.PixelIndex[sel])
+        frameValues = [np.full(nPix, int(getattr(eventFrame, name)), dtype=np.uint64) for name in CsvFrameColumns]
+        self._write(channel, frameValues + [getattr(pix, src)[sel] for _, src, _ in CsvColumns[len(CsvFrameColumns):]])
+
+    def acceptEvent(self, eventFrame):
+        # EventDecoder subscriber interface
+        self.writeEvent(eventFrame.Channel, eventFrame)
+
+    def writeBatch(self, batch):
+        # Many decoded frames (EventBatch), split by channel
+        pix     = batch.pixArray
+        hitChan = batch.Channel[batch.FrameIndex]
+        keep    = self.hitFilter.mask(pix) if self.hitFilter is not None else np.ones(len(hitChan), dtype=bool)
+        for channel in np.unique(batch.Channel).tolist():
+            sel    = np.flatnonzero(keep & (hitChan == channel))
+            frames = batch.FrameIndex[sel]
+            self._write(channel, [getattr(batch, name)[frames] for name in CsvFrameColumns] +
+                                 [getattr(pix, src)[sel] for _, src, _ in CsvColumns[len(CsvFrameColumns):]])
+
+    def flush(self):
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
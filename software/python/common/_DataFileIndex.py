@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import os
+import struct
+import numpy as np
+
+from common._DataFileReader import DataFile
+
+#################################################################
+
+# Sidecar index file (<data file>.idx):
+#   header: magic, version, number of data file bytes already indexed
+#   body:   one IndexDtype record per frame of the data file
+IndexHeader  = struct.Struct('<8sIQ')
+IndexMagic   = b'ALTIDX\x00\x00'
+IndexVersion = 1
+
+IndexDtype = np.dtype([
+    ('Offset',      '<u8'),  # byte offset of the record header in the data file
+    ('Channel',     'u1'),   # FPGA index or 128+i for the SEM channel
+    ('PayloadSize', '<u4'),
+    ('SeqCnt',      '<u4'),
+    ('TrigCnt',     '<u4'),
+    ('Timestamp',   '<u8'),
+])
+
+class DataFileIndex(object):
+    '''
+    Frame index of a rogue data file, kept in a sidecar file next to it.
+    The index is built on first use and extended incrementally when the data
+    file has grown since it was last indexed.
+
+        index = feb.DataFileIndex('TestData/run.dat')
+        i     = index.findSeqCnt(1234, channel=0)
+        batch = index.read(i, i+1)[0]
+        for start, stop in index.chunks(100000):
+            ...   # DataFile.read(start=start, stop=stop), e.g. in a process pool
+    '''
+    def __init__(self, path, update=True):
+        self.path     = path
+        self.idxPath  = path + '.idx'
+        self.records  = np.zeros(0, dtype=IndexDtype)
+        self.indexed  = 0
+        self._sorted  = {}
+        self._load()
+        if update:
+            self.update()
+
+    def __len__(self):
+        return len(self.records)
+
+    def _load(self):
+        if not os.path.exists(self.idxPath):
+            return
+        with open(self.idxPath, 'rb') as f:
+            header = f.read(IndexHeader.size)
+            if len(header) < IndexHeader.size:
+                return
+            magic, version, indexed = IndexHeader.unpack(header)
+            if (magic != IndexMagic) or (version != IndexVersion):
+                return
+            records = np.fromfile(f, dtype=IndexDtype)
+
+        # A data file smaller than what was indexed has been rewritten: rebuild
+        if indexed > os.path.getsize(self.path):
+            return
+        self.records = records
+        self.indexed = indexed
+
+    def update(self):
+        # Index the records written since the last update; returns the number of new frames
+        if os.path.getsize(self.path) <= self.indexed:
+            return 0
+
+        with DataFile(self.path) as dataFile:
+            hdr = dataFile.headers(start=self.indexed)
+            new = np.zeros(len(hdr), dtype=IndexDtype)
+            new['Offset']      = hdr.Offset
+            new['Channel']     = hdr.Channel
+            new['PayloadSize'] = hdr.PayloadSize
+            if len(hdr):
+                words = dataFile.headerWords(hdr.Offset, hdr.PayloadSize)
+                new['SeqCnt']    = words[:,1]
+                new['TrigCnt']   = words[:,2]
+                new['Timestamp'] = (words[:,4].astype(np.uint64) << np.uint64(32)) | words[:,3]
+
+        # Append to the sidecar file, then record how far the data file is indexed
+        mode = 'r+b' if (self.indexed > 0) and os.path.exists(self.idxPath) else 'wb'
+        with open(self.idxPath, mode) as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                f.write(IndexHeader.pack(IndexMagic, IndexVersion, 0))
+            new.tofile(f)
+            f.seek(0)
+            f.write(IndexHeader.pack(IndexMagic, IndexVersion, hdr.nextOffset))
+
+        self.records = np.concatenate((self.records, new))
+        self.indexed = hdr.nextOffset
+        self._sorted = {}
+        return len(new)
+
+    def channel(self, channel):
+        # Record numbers of one channel
+        return np.flatnonzero(self.records['Channel'] == channel)
+
+    def _find(self, field, value, channel):
+        # Binary search on the channel's records sorted by field (sort cached until next update)
+        key = (field, channel)
+        if key not in self._sorted:
+            rows = self.channel(channel)
+            rows = rows[np.argsort(self.records[field][rows], kind='stable')]
+            self._sorted[key] = (rows, self.records[field][rows])
+        rows, values = self._sorted[key]
+        i = np.searchsorted(values, value, side='left')
+        return rows, values, i
+
+    def findSeqCnt(self, seqCnt, channel=0):
+        # Record number of the frame with this SeqCnt, -1 if none
+        rows, values, i = self._find('SeqCnt', seqCnt, channel)
+        if (i < len(rows)) and (values[i] == seqCnt):
+            return int(rows[i])
+        return -1
+
+    def findTimestamp(self, timestamp, channel=0):
+        # Record number of the first frame at or after timestamp, -1 if none
+        rows, values, i = self._find('Timestamp', timestamp, channel)
+        if i < len(rows):
+            return int(rows[i])
+        return -1
+
+    def chunks(self, framesPerChunk):
+        # Split the data file into [start,stop) byte ranges on record boundaries
+        starts = self.records['Offset'][::framesPerChunk].astype(np.int64)
+        stops  = np.append(starts[1:], self.indexed)
+        return list(zip(starts.tolist(), stops.tolist()))
+
+    def read(self, first=0, last=None, channels=None):
+        # Decode records [first,last) into {channel: EventBatch} without walking the file
+        records = self.records[first:last]
+        with DataFile(self.path) as dataFile:
+            batches = dataFile.decodeRecords(records['Offset'], records['PayloadSize'], records['Channel'], channels)
+        return batches
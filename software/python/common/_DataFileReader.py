@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import os
+import mmap
+import struct
+import numpy as np
+
+from common._DataStreamReader import ParseFrames, ConcatBatches
+
+#################################################################
+
+# Each record of a rogue data file (pr.utilities.fileio.StreamWriter) is:
+#   [31:0]  size of the record in bytes, not counting this word
+#   [15:0]  frame flags, [23:16] frame error, [31:24] channel
+#   followed by (size-4) bytes of frame payload
+RecordHeader = struct.Struct('<II')
+
+# Channels >= 128 are the SEM ASCII streams (see Top)
+SemChannelOffset = 128
+
+class RecordHeaders(object):
+    def __init__(self, Offset, PayloadSize, Channel, Error, Flags, nextOffset):
+        self.Offset      = Offset       # byte offset of the record header
+        self.PayloadSize = PayloadSize  # frame payload size in bytes
+        self.Channel     = Channel
+        self.Error       = Error
+        self.Flags       = Flags
+        self.nextOffset  = nextOffset   # byte offset where the next walk should resume
+
+    def __len__(self):
+        return len(self.Offset)
+
+def ReadRecordHeaders(data, start=0, stop=None, maxRecords=None):
+    # Walk the record headers of a rogue data file held in a buffer (bytes or mmap).
+    # Only the 8-byte headers are touched; a partially written record at the end is left for the next walk.
+    stop = len(data) if stop is None else min(stop, len(data))
+    Offset, PayloadSize, Info = [], [], []
+    pos = start
+    unpack = RecordHeader.unpack_from
+    while (pos+8 <= stop) and ((maxRecords is None) or (len(Offset) < maxRecords)):
+        size, info = unpack(data, pos)
+        if (size < 4) or (pos+4+size > stop):
+            break
+        Offset.append(pos)
+        PayloadSize.append(size-4)
+        Info.append(info)
+        pos += 4+size
+
+    Info = np.array(Info, dtype=np.uint32)
+    return RecordHeaders(
+        Offset      = np.array(Offset, dtype=np.uint64),
+        PayloadSize = np.array(PayloadSize, dtype=np.uint32),
+        Channel     = ((Info >> 24) & 0xFF).astype(np.uint8),
+        Error       = ((Info >> 16) & 0xFF).astype(np.uint8),
+        Flags       = ((Info >>  0) & 0xFFFF).astype(np.uint16),
+        nextOffset  = pos,
+    )
+
+#################################################################
+
+class DataFile(object):
+    '''
+    Memory-mapped reader for the rogue .dat files written by Top.dataWriter.
+    The data frames are decoded into per-channel EventBatch objects without
+    going through rogue.utilities.fileio.StreamReader.
+
+        with feb.DataFile('TestData/TOA100.dat') as dataFile:
+            batches = dataFile.read()         # {channel: EventBatch}
+            for batches in dataFile.iterate(chunkFrames=100000):
+                ...
+    '''
+    def __init__(self, path):
+        self.path  = path
+        self._file = open(path, 'rb')
+        self._map  = None
+        self.remap()
+
+    def remap(self):
+        # (Re)map the file, e.g. after it has grown
+        self._words = None
+        if self._map is not None:
+            self._map.close()
+        self.size = os.fstat(self._file.fileno()).st_size
+        if self.size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            # uint32 views of the file at the four possible byte alignments of a payload
+            self._words = [np.frombuffer(self._map, dtype='<u4', offset=a, count=(self.size-a)>>2) for a in range(4)]
+        else:
+            self._map = None
+
+    def close(self):
+        self._words = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def headers(self, start=0, stop=None, maxRecords=None):
+        if self._map is None:
+            return ReadRecordHeaders(b'', start, stop, maxRecords)
+        return ReadRecordHeaders(self._map, start, stop, maxRecords)
+
+    def decode(self, Offset, PayloadSize, Channel):
+        # Decode the data frames of the records starting at byte offsets Offset
+        Offset  = np.asarray(Offset, dtype=np.int64)
+        payload = Offset+8
+        align   = payload & 0x3
+        if not align.any():
+            return ParseFrames(self._words[0], payload >> 2, PayloadSize, Channel, fileOffsets=Offset)
+
+        # Payloads that do not start on a 32-bit boundary are decoded from the matching view
+        batches, order = [], []
+        for a in np.unique(align):
+            sel = np.flatnonzero(align == a)
+            batches.append(ParseFrames(self._words[a], (payload[sel]-a) >> 2, PayloadSize[sel], Channel[sel], fileOffsets=Offset[sel]))
+            order.append(sel)
+        return ConcatBatches(batches).select(np.argsort(np.concatenate(order), kind='stable'))
+
+    def headerWords(self, Offset, PayloadSize, count=5):
+        # First count payload words of the records at byte offsets Offset, shape (n, count).
+        # Words beyond the end of a payload read as zero.
+        Offset  = np.asarray(Offset, dtype=np.int64)
+        words   = np.zeros((len(Offset), count), dtype=np.uint32)
+        payload = Offset+8
+        align   = payload & 0x3
+        for a in np.unique(align):
+            sel = np.flatnonzero(align == a)
+            idx = (payload[sel]-a) >> 2
+            for i in range(count):
+                valid = np.asarray(PayloadSize)[sel] > 4*i
+                words[sel[valid], i] = self._words[a][idx[valid]+i]
+        return words
+
+    def decodeRecords(self, Offset, PayloadSize, Channel, channels=None):
+        # Decode the selected channels (default: all data channels) into {channel: EventBatch}
+        Offset, PayloadSize, Channel = np.asarray(Offset), np.asarray(PayloadSize), np.asarray(Channel)
+        if channels is None:
+            keep = Channel < SemChannelOffset
+        else:
+            keep = np.isin(Channel, list(channels))
+        if not keep.any():
+            return {}
+        batch = self.decode(Offset[keep], PayloadSize[keep], Channel[keep])
+        return {int(ch): batch.select(batch.Channel == ch) for ch in np.unique(batch.Channel)}
+
+    def _decodeHeaders(self, hdr, channels):
+        return self.decodeRecords(hdr.Offset, hdr.PayloadSize, hdr.Channel, channels)
+
+    def read(self, channels=None, start=0, stop=None):
+        # Decode the whole file (or the [start,stop) byte range) into {channel: EventBatch}
+        return self._decodeHeaders(self.headers(start, stop), channels)
+
+    def iterate(self, chunkFrames=100000, channels=None, start=0):
+        # Decode the file chunkFrames records at a time, yielding {channel: EventBatch}
+        pos = start
+        while True:
+            hdr = self.headers(pos, maxRecords=chunkFrames)
+            if len(hdr) == 0:
+                return
+            pos = hdr.nextOffset
+            batches = self._decodeHeaders(hdr, channels)
+            if batches:
+                yield batches
+
+#################################################################
+
+def ReadDataFile(path, channel=None, channels=None):
+    '''
+    Decode a whole rogue data file. Returns {channel: EventBatch} or, if channel
+    is given, the EventBatch of that channel only (empty if it has no frames).
+    '''
+    with DataFile(path) as dataFile:
+        batches = dataFile.read(channels=channels if channel is None else [channel])
+    if channel is None:
+        return batches
+    if channel not in batches:
+        return ParseFrames(np.zeros(0, dtype=np.uint32), [], [], [])
+    return batches[channel]
+
+def IterDataFile(path, chunkFrames=100000, channels=None):
+    # Chunked version of ReadDataFile
+    with DataFile(path) as dataFile:
+        for batches in dataFile.iterate(chunkFrames=chunkFrames, channels=channels):
+            yield batches
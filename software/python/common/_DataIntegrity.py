@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import time
+import threading
+import numpy as np
+
+import rogue
+import pyrogue as pr
+
+from common._DataStreamReader import EventBatch
+from common._SlaveMonitor     import SlaveMonitor
+
+#################################################################
+
+IntegrityCounters = [
+    'Frames',            # frames checked
+    'PayloadTruncated',  # payload shorter than ReadoutSize/PixReadIteration require
+    'PayloadOversize',   # payload longer than ReadoutSize/PixReadIteration require
+    'SeqCntGaps',        # SeqCnt discontinuities (lost frames)
+    'SeqCntLost',        # number of frames missing in those discontinuities
+    'SeqCntResets',      # SeqCnt restarted or went backwards (e.g. StartRun)
+    'TrigCntErrors',     # TrigCnt went backwards
+    'TimestampErrors',   # Timestamp went backwards
+    'DropTrigCntIncr',   # growth of dropTrigCnt
+]
+
+class DataIntegrityChecker(object):
+    '''
+    Vectorized consistency checks over batches of frame headers (any EventBatch,
+    e.g. from DataFile, or the header-only batches built by DataIntegrityReader).
+    The last header of every channel is carried over to the next batch.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {name: 0 for name in IntegrityCounters}
+            self._last    = {}
+
+    def check(self, batch):
+        with self._lock:
+            # Payload length vs. ReadoutSize/PixReadIteration: header + data words + dropTrigCnt
+            numPix   = (batch.ReadoutSize.astype(np.int64)+1)*(batch.PixReadIteration.astype(np.int64)+1)
+            expected = 4*(5+numPix+1)
+            payload  = batch.PayloadSize.astype(np.int64)
+            self.counters['Frames']           += len(payload)
+            self.counters['PayloadTruncated'] += int(np.count_nonzero(payload < expected))
+            self.counters['PayloadOversize']  += int(np.count_nonzero(payload > expected))
+
+            for ch in np.unique(batch.Channel):
+                sel = np.flatnonzero(batch.Channel == ch)
+                self._checkChannel(int(ch), batch.SeqCnt[sel], batch.TrigCnt[sel], batch.Timestamp[sel], batch.dropTrigCnt[sel])
+
+    def _checkChannel(self, ch, SeqCnt, TrigCnt, Timestamp, dropTrigCnt):
+        SeqCnt      = SeqCnt.astype(np.int64)
+        TrigCnt     = TrigCnt.astype(np.int64)
+        Timestamp   = Timestamp.astype(np.uint64)
+        dropTrigCnt = dropTrigCnt.astype(np.int64)
+
+        # Prepend the last frame of the previous batch
+        if ch in self._last:
+            last        = self._last[ch]
+            SeqCnt      = np.concatenate(([last[0]], SeqCnt))
+            TrigCnt     = np.concatenate(([last[1]], TrigCnt))
+            Timestamp   = np.concatenate((np.array([last[2]], dtype=np.uint64), Timestamp))
+            dropTrigCnt = np.concatenate(([last[3]], dropTrigCnt))
+        self._last[ch] = (SeqCnt[-1], TrigCnt[-1], Timestamp[-1], dropTrigCnt[-1])
+
+        if len(SeqCnt) < 2:
+            return
+
+        # 32-bit SeqCnt steps by one per frame (modulo wrap-around)
+        seqStep = np.diff(SeqCnt) & 0xFFFFFFFF
+        reset   = (seqStep == 0) | (seqStep >= 0x80000000)
+        gap     = (seqStep > 1) & ~reset
+        self.counters['SeqCntResets'] += int(np.count_nonzero(reset))
+        self.counters['SeqCntGaps']   += int(np.count_nonzero(gap))
+        self.counters['SeqCntLost']   += int((seqStep[gap]-1).sum())
+
+        # The other counters are only compared inside the same run
+        run = ~reset
+        trigStep = np.diff(TrigCnt) & 0xFFFFFFFF
+        self.counters['TrigCntErrors']   += int(np.count_nonzero(run & (trigStep >= 0x80000000)))
+        self.counters['TimestampErrors'] += int(np.count_nonzero(run & (Timestamp[1:] < Timestamp[:-1])))
+        dropStep = np.diff(dropTrigCnt)
+        self.counters['DropTrigCntIncr'] += int(dropStep[run & (dropStep > 0)].sum())
+
+#################################################################
+
+class DataIntegrityReader(SlaveMonitor, rogue.interfaces.stream.Slave):
+    # Copies only the header words (and dropTrigCnt) of each frame and runs the
+    # checker once batchSize frames have been collected, or flushInterval seconds
+    # after the last check so that the counters do not go stale at low rates
+    def __init__(self, checker, batchSize=256, flushInterval=1.0):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.checker   = checker
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self._lastFlush    = time.monotonic()
+        self._lock     = threading.Lock()
+        self._header   = np.zeros(5*4, dtype=np.uint8)
+        self._drop     = np.zeros(4, dtype=np.uint8)
+        self._words    = np.zeros((batchSize, 6), dtype=np.uint32)
+        self._payload  = np.zeros(batchSize, dtype=np.uint32)
+        self._channel  = np.zeros(batchSize, dtype=np.uint8)
+        self._count    = 0
+
+    def _acceptFrame(self, frame):
+        with frame.lock():
+            size = frame.getPayload()
+            with self._lock:
+                i = self._count
+                words = self._words[i]
+                words[:] = 0
+                if size >= self._header.size:
+                    frame.read(self._header, 0)
+                    words[:5] = self._header.view(np.uint32)
+                    numPix = (((int(words[0]) >> 27) & 0x1F)+1)*(((int(words[0]) >> 12) & 0x1FF)+1)
+                    if 4*(5+numPix+1) <= size:
+                        frame.read(self._drop, 4*(5+numPix))
+                        words[5] = self._drop.view(np.uint32)[0]
+                self._payload[i] = size
+                self._channel[i] = frame.getChannel()
+                self._count += 1
+                if (self._count == self.batchSize) or ((time.monotonic() - self._lastFlush) >= self.flushInterval):
+                    self._flush()
+
+    def _flush(self):
+        self._lastFlush = time.monotonic()
+        n = self._count
+        if n == 0:
+            return
+        words = self._words[:n]
+        batch = EventBatch()
+        batch.Channel          = self._channel[:n]
+        batch.PayloadSize      = self._payload[:n]
+        batch.PixReadIteration = (words[:,0] >> 12) & 0x1FF
+        batch.ReadoutSize      = (words[:,0] >> 27) & 0x1F
+        batch.SeqCnt           = words[:,1]
+        batch.TrigCnt          = words[:,2]
+        batch.Timestamp        = (words[:,4].astype(np.uint64) << np.uint64(32)) | words[:,3]
+        batch.dropTrigCnt      = words[:,5]
+        self.checker.check(batch)
+        self._count = 0
+
+    def flush(self):
+        # Check the frames collected so far (partial batch)
+        with self._lock:
+            self._flush()
+
+    def flushStale(self):
+        # flush() if the collected frames wait for more than flushInterval
+        with self._lock:
+            if (self._count > 0) and ((time.monotonic() - self._lastFlush) >= self.flushInterval):
+                self._flush()
+
+    def stop(self):
+        self.flush()
+
+#################################################################
+
+class DataIntegrity(pr.Device):
+    '''
+    Live data stream validation. Tap the reader into a data stream:
+        pr.streamTap(top.dataStream[i], top.DataIntegrity[i].reader)
+    '''
+    def __init__(self,
+            name        = 'DataIntegrity',
+            description = 'Data stream integrity counters',
+            batchSize   = 256,
+            flushInterval = 1.0,
+            **kwargs):
+
+        super().__init__(
+            name        = name,
+            description = description,
+            **kwargs)
+
+        self.checker = DataIntegrityChecker()
+        self.reader  = DataIntegrityReader(self.checker, batchSize, flushInterval)
+        self.reader.monitorName = name
+
+        for counter in IntegrityCounters:
+            self.add(pr.LocalVariable(
+                name         = counter,
+                mode         = 'RO',
+                value        = 0,
+                localGet     = lambda counter=counter: self._counter(counter),
+                pollInterval = 1,
+            ))
+
+        @self.command(description='Check the frames received since the last full batch')
+        def Flush():
+            self.reader.flush()
+
+        @self.command(description='Reset the integrity counters')
+        def CountReset():
+            self.reader.flush()
+            self.checker.reset()
+
+    def _counter(self, counter):
+        # The frames still waiting for a full batch are checked before the counters are read
+        self.reader.flushStale()
+        return self.checker.counters[counter]
+
+    def stop(self):
+        # Check the last partial batch (end of run)
+        self.reader.stop()
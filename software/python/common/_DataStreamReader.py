@@ -7,14 +7,20 @@ import time
 import random
 import argparse
 import pyrogue as pr
-import pyrogue.gui
 import numpy as np
 import rogue.utilities.fileio
 import statistics
 import math
-import matplotlib.pyplot as plt
 import csv
 import click
+import queue
+import threading
+
+from common._TotDecoding import GetTotTable
+from common._HitStore    import HitStore
+from common._CsvExport   import CsvExporter
+from common._HitFilter   import HitSelect, PrintSelect
+from common._SlaveMonitor import SlaveMonitor
 
 #################################################################
 
@@ -28,17 +34,61 @@ class PixValue(object):
      self.Hit         = Hit
      self.Sof         = Sof
 
+class PixArray(object):
+  # Struct-of-arrays view of the 32-bit pixel data words (one entry per word)
+  def __init__(self, PixelIndex, TotOverflow, TotData, ToaOverflow, ToaData, Hit, Sof):
+     self.PixelIndex  = PixelIndex
+     self.TotOverflow = TotOverflow
+     self.TotData     = TotData
+     self.ToaOverflow = ToaOverflow
+     self.ToaData     = ToaData
+     self.Hit         = Hit
+     self.Sof         = Sof
+
+  def __len__(self):
+     return len(self.PixelIndex)
+
+  def select(self, mask):
+     # New PixArray with the data words selected by mask (e.g. from a HitFilter)
+     return PixArray(self.PixelIndex[mask], self.TotOverflow[mask], self.TotData[mask],
+                     self.ToaOverflow[mask], self.ToaData[mask], self.Hit[mask], self.Sof[mask])
+
+  def __getitem__(self, i):
+     # Legacy per-pixel view of a single data word
+     return PixValue(
+        int(self.PixelIndex[i]),
+        int(self.TotOverflow[i]),
+        int(self.TotData[i]),
+        int(self.ToaOverflow[i]),
+        int(self.ToaData[i]),
+        int(self.Hit[i]),
+        int(self.Sof[i]))
+
 class EventValue(object):
   def __init__(self):
+     self.Channel           = None
+     self.PayloadSize       = None
      self.FormatVersion     = None
      self.PixReadIteration  = None
      self.ReadoutSize       = None
      self.SeqCnt            = None
      self.TrigCnt           = None
+     self.pixArray          = None
      self.pixValue          = None
      self.dropTrigCnt       = None
      self.Timestamp         = None
 
+  @property
+  def pixValue(self):
+     # The PixValue list is only built when a legacy consumer asks for it
+     if (self._pixValue is None) and (self.pixArray is not None):
+        self._pixValue = [self.pixArray[i] for i in range(len(self.pixArray))]
+     return self._pixValue
+
+  @pixValue.setter
+  def pixValue(self, value):
+     self._pixValue = value
+
 def ParseDataWord(dataWord):
     #Parse the 32-bit word
     PixelIndex  = (dataWord >> 24) & 0x1F
@@ -52,7 +102,44 @@ def ParseDataWord(dataWord):
     #print( "{:028b}".format(dataWord) )
     return PixValue(PixelIndex, TotOverflow, TotData, ToaOverflow, ToaData, Hit, Sof)
 
-def ParseFrame(frame):
+def ParseDataWords(dataWords):
+    # Parse an array of 32-bit words with a single set of shift/mask operations
+    dataWords = np.asarray(dataWords, dtype=np.uint32)
+    PixelIndex  = ((dataWords >> 24) & 0x1F ).astype(np.uint8)
+    TotOverflow = ((dataWords >> 20) & 0x1  ).astype(np.uint8)
+    TotData     = ((dataWords >> 11) & 0x1FF).astype(np.uint16)
+    ToaOverflow = ((dataWords >> 10) & 0x1  ).astype(np.uint8)
+    ToaData     = ((dataWords >>  3) & 0x7F ).astype(np.uint8)
+    Hit         = ((dataWords >>  2) & 0x1  ).astype(np.uint8)
+    Sof         = ((dataWords >>  0) & 0x3  ).astype(np.uint8)
+
+    return PixArray(PixelIndex, TotOverflow, TotData, ToaOverflow, ToaData, Hit, Sof)
+
+def ParseFrameWords(wrdData, pixWords=None):
+    # Parse the data and data to data frame
+    eventFrame = EventValue()
+    eventFrame.FormatVersion     = (wrdData[0] >>  0) & 0xFFF
+    eventFrame.PixReadIteration  = (wrdData[0] >> 12) & 0x1FF
+    eventFrame.ReadoutSize       = (wrdData[0] >> 27) & 0x1F
+    eventFrame.SeqCnt            = wrdData[1]
+    eventFrame.TrigCnt           = wrdData[2]
+    eventFrame.Timestamp         = (int(wrdData[4]) << 32) | (int(wrdData[3]) << 0)
+    numPixValues = (eventFrame.ReadoutSize+1)*(eventFrame.PixReadIteration+1)
+    if pixWords is None:
+        eventFrame.pixArray  = ParseDataWords(wrdData[5:5+numPixValues])
+    else:
+        eventFrame.pixArray  = pixWords(wrdData[5:5+numPixValues])
+
+    # A truncated payload has no dropTrigCnt (see DataIntegrityChecker)
+    eventFrame.dropTrigCnt = wrdData[numPixValues+5] if (numPixValues+5 < len(wrdData)) else 0
+
+    return eventFrame
+
+def ParseFrame(frame, decoder=None):
+    # Use the reader's preallocated buffers if it has a FrameDecoder
+    if decoder is not None:
+        return decoder.parse(frame)
+
     # Next we can get the size of the frame payload
     size = frame.getPayload()
 
@@ -63,201 +150,397 @@ def ParseFrame(frame):
     frame.read(fullData,0)
 
     # Fill an array of 32-bit formatted word
-    wrdData = [None for i in range(5+512*32+1)]
     wrdData = np.frombuffer(fullData, dtype='uint32', count=(size>>2))
 
-    # Parse the data and data to data frame
-    eventFrame = EventValue()
-    eventFrame.FormatVersion     = (wrdData[0] >>  0) & 0xFFF
-    eventFrame.PixReadIteration  = (wrdData[0] >> 12) & 0x1FF
-    eventFrame.ReadoutSize       = (wrdData[0] >> 27) & 0x1F
-    eventFrame.SeqCnt            = wrdData[1]
-    eventFrame.TrigCnt           = wrdData[2]
-    eventFrame.Timestamp         = (wrdData[4] << 32) | (wrdData[3] << 0)
-    numPixValues = (eventFrame.ReadoutSize+1)*(eventFrame.PixReadIteration+1)
-    eventFrame.pixValue  = [None for i in range(numPixValues)]
-    for i in range(numPixValues):
-        eventFrame.pixValue[i] = ParseDataWord(wrdData[5+i])
-    eventFrame.dropTrigCnt = wrdData[numPixValues+5]
-
+    eventFrame = ParseFrameWords(wrdData)
+    eventFrame.Channel     = frame.getChannel()
+    eventFrame.PayloadSize = size
     return eventFrame
 
+# Layout of the 32-bit pixel data word: (name, shift, mask, dtype)
+PixFieldFormat = [
+    ('PixelIndex',  24, 0x1F,  np.uint8),
+    ('TotOverflow', 20, 0x1,   np.uint8),
+    ('TotData',     11, 0x1FF, np.uint16),
+    ('ToaOverflow', 10, 0x1,   np.uint8),
+    ('ToaData',      3, 0x7F,  np.uint8),
+    ('Hit',          2, 0x1,   np.uint8),
+    ('Sof',          0, 0x3,   np.uint8),
+]
+PixFields = [name for name, shift, mask, dtype in PixFieldFormat]
+
+class FrameDecoder(object):
+  # Per-reader frame decoder that reuses its frame and column buffers, so that decoding
+  # a frame does not allocate anything proportional to the frame size. The arrays of the
+  # returned EventValue are views into these buffers and are only valid until the next
+  # call to parse(): copy whatever must be kept. Not thread safe (one per reader).
+  def __init__(self, size=0x10000):
+     self._allocate(size)
+
+  def _allocate(self, size):
+     size = (size+3) & ~0x3
+     self._bytes   = np.zeros(size, dtype=np.uint8)
+     self._words   = self._bytes.view(np.uint32)
+     self._scratch = np.zeros(size>>2, dtype=np.uint32)
+     self._columns = [np.zeros(size>>2, dtype=dtype) for name, shift, mask, dtype in PixFieldFormat]
+
+  def read(self, frame):
+     # Copy the frame payload into the buffer (grown geometrically) and return its 32-bit words
+     size = frame.getPayload()
+     if size > self._bytes.size:
+        self._allocate(max(size, 2*self._bytes.size))
+     frame.read(self._bytes[:size], 0)
+     return self._words[:size>>2]
+
+  def parseWords(self, dataWords):
+     n = len(dataWords)
+     scratch = self._scratch[:n]
+     for (name, shift, mask, dtype), column in zip(PixFieldFormat, self._columns):
+        np.right_shift(dataWords, shift, out=scratch)
+        np.bitwise_and(scratch, mask, out=scratch)
+        column[:n] = scratch
+     return PixArray(*[column[:n] for column in self._columns])
+
+  def parse(self, frame):
+     eventFrame = ParseFrameWords(self.read(frame), self.parseWords)
+     eventFrame.Channel     = frame.getChannel()
+     eventFrame.PayloadSize = frame.getPayload()
+     return eventFrame
+
+#################################################################
+
+class EventBatch(object):
+  # Columnar view of many event frames: one entry per frame in the header
+  # arrays and one entry per data word in pixArray (FrameIndex maps a data
+  # word back to its frame and HitStart/NumPix map a frame to its data words)
+  def __init__(self):
+     self.Offset            = None
+     self.Channel           = None
+     self.PayloadSize       = None
+     self.FormatVersion     = None
+     self.PixReadIteration  = None
+     self.ReadoutSize       = None
+     self.SeqCnt            = None
+     self.TrigCnt           = None
+     self.Timestamp         = None
+     self.dropTrigCnt       = None
+     self.HitStart          = None
+     self.NumPix            = None
+     self.FrameIndex        = None
+     self.pixArray          = None
+
+  def __len__(self):
+     return len(self.SeqCnt)
+
+  def numHits(self):
+     return len(self.FrameIndex)
+
+  def event(self, i):
+     # Legacy EventValue view of a single frame
+     eventFrame = EventValue()
+     eventFrame.Channel          = int(self.Channel[i])
+     eventFrame.PayloadSize      = int(self.PayloadSize[i])
+     eventFrame.FormatVersion    = int(self.FormatVersion[i])
+     eventFrame.PixReadIteration = int(self.PixReadIteration[i])
+     eventFrame.ReadoutSize      = int(self.ReadoutSize[i])
+     eventFrame.SeqCnt           = int(self.SeqCnt[i])
+     eventFrame.TrigCnt          = int(self.TrigCnt[i])
+     eventFrame.Timestamp        = int(self.Timestamp[i])
+     eventFrame.dropTrigCnt      = int(self.dropTrigCnt[i])
+     hits = slice(self.HitStart[i], self.HitStart[i]+self.NumPix[i])
+     eventFrame.pixArray = PixArray(*[getattr(self.pixArray, name)[hits] for name in PixFields])
+     return eventFrame
+
+  def select(self, frames):
+     # Return a new batch holding only the selected frames (boolean mask or frame indices)
+     frames = np.asarray(frames)
+     if frames.dtype == bool:
+        frames = np.flatnonzero(frames)
+     batch = EventBatch()
+     for name in EventFields:
+        setattr(batch, name, getattr(self, name)[frames])
+     batch.NumPix     = self.NumPix[frames]
+     batch.HitStart   = np.cumsum(batch.NumPix) - batch.NumPix
+     batch.FrameIndex = np.repeat(np.arange(len(batch.NumPix), dtype=np.int64), batch.NumPix)
+     hitIndex = self.HitStart[frames][batch.FrameIndex] + (np.arange(batch.FrameIndex.size) - batch.HitStart[batch.FrameIndex])
+     batch.pixArray   = PixArray(*[getattr(self.pixArray, name)[hitIndex] for name in PixFields])
+     return batch
+
+def ConcatBatches(batches):
+    # Join several EventBatch into one, keeping the frame order
+    batch = EventBatch()
+    for name in EventFields+['NumPix']:
+        setattr(batch, name, np.concatenate([getattr(b, name) for b in batches]))
+    batch.HitStart   = np.cumsum(batch.NumPix) - batch.NumPix
+    batch.FrameIndex = np.repeat(np.arange(len(batch.NumPix), dtype=np.int64), batch.NumPix)
+    batch.pixArray   = PixArray(*[np.concatenate([getattr(b.pixArray, name) for b in batches]) for name in PixFields])
+    return batch
+
+# Names of the per-frame columns of an EventBatch
+EventFields = ['Offset', 'Channel', 'PayloadSize', 'FormatVersion', 'PixReadIteration',
+               'ReadoutSize', 'SeqCnt', 'TrigCnt', 'Timestamp', 'dropTrigCnt']
+
+def ParseFrames(words, offsets, payloadSize, channels, fileOffsets=None):
+    # Decode many frames at once. words is a uint32 array holding the frames,
+    # offsets the index of each frame's first word in words and payloadSize
+    # the frame payload sizes in bytes.
+    offsets     = np.asarray(offsets, dtype=np.int64)
+    payloadSize = np.asarray(payloadSize, dtype=np.uint32)
+    payloadWrds = (payloadSize >> 2).astype(np.int64)
+
+    def header(i):
+        # Frames too short to hold header word i read as zero
+        valid = payloadWrds > i
+        return np.where(valid, words[np.where(valid, offsets+i, 0)], 0).astype(np.uint32)
+
+    batch = EventBatch()
+    batch.Offset           = (offsets if fileOffsets is None else np.asarray(fileOffsets)).astype(np.uint64)
+    batch.Channel          = np.asarray(channels, dtype=np.uint8)
+    batch.PayloadSize      = payloadSize
+    wrd0                   = header(0)
+    batch.FormatVersion    = ((wrd0 >>  0) & 0xFFF).astype(np.uint16)
+    batch.PixReadIteration = ((wrd0 >> 12) & 0x1FF).astype(np.uint16)
+    batch.ReadoutSize      = ((wrd0 >> 27) & 0x1F ).astype(np.uint8)
+    batch.SeqCnt           = header(1)
+    batch.TrigCnt          = header(2)
+    batch.Timestamp        = (header(4).astype(np.uint64) << np.uint64(32)) | header(3).astype(np.uint64)
+
+    # Clamp the number of data words to what the payload actually holds
+    numPix = (batch.ReadoutSize.astype(np.int64)+1)*(batch.PixReadIteration.astype(np.int64)+1)
+    numPix = np.clip(np.minimum(numPix, payloadWrds-5), 0, None)
+    batch.NumPix   = numPix
+    batch.HitStart = np.cumsum(numPix) - numPix
+
+    # dropTrigCnt follows the data words (zero if the payload was truncated)
+    dropIdx = offsets+5+numPix
+    valid   = (dropIdx < offsets+payloadWrds)
+    batch.dropTrigCnt = np.where(valid, words[np.where(valid, dropIdx, 0)], 0).astype(np.uint32)
+
+    # Gather all data words into one contiguous array
+    batch.FrameIndex = np.repeat(np.arange(len(numPix), dtype=np.int64), numPix)
+    wordIndex = np.arange(batch.FrameIndex.size, dtype=np.int64) - batch.HitStart[batch.FrameIndex]
+    wordIndex += offsets[batch.FrameIndex] + 5
+    batch.pixArray = ParseDataWords(words[wordIndex])
+
+    return batch
+
 #################################################################
 
 # Class for printing out events
-class PrintEventReader(rogue.interfaces.stream.Slave):
+class PrintEventReader(SlaveMonitor, rogue.interfaces.stream.Slave):
+    '''
+    printMode:
+        'sync'    : print every hit from the rogue receive thread (low-rate debugging)
+        'full'    : print every hit from a background thread
+        'summary' : print per-interval summaries (events/s, hits per pixel, drops) from a background thread
+    In the background modes the decoded hits are handed over through a bounded queue
+    of queueSize events; events that do not fit are dropped and counted in dropCount.
+    Can also be subscribed to an EventDecoder instead of being connected to a stream.
+    hitFilter selects the printed hits (HitFilter, default Hit set and ToaData != 0x7F).
+    '''
     # Init method must call the parent class init
-    def __init__(self, cvsDump=False):
+    def __init__(self, cvsDump=False, printMode='full', queueSize=1000, summaryInterval=1.0, exporter=None, hitFilter=PrintSelect):
         super().__init__()
-        self.count   = 0
-        self.cvsDump = cvsDump
-        if cvsDump:
-            self.file   = [None for i in range(2)]
-            self.writer = [None for i in range(2)]
-            for i in range(2):
-                self.file[i]   = open(f'fpga{i}.csv', 'w', newline='')
-                self.writer[i] = csv.writer(self.file[i])
-                self.writer[i].writerow([
-                    'Timestamp',    # 0 = Timestamp
-                    'SeqCnt',       # 1 = SeqCnt
-                    'TrigCnt',      # 2 = TrigCnt
-                    'DropTrigCnt',  # 3 = DropTrigCnt
-                    'pixIndex',     # 4 = pixIndex
-                    'TotOverflow',  # 5 = TotOverflow
-                    'TotData',      # 6 = TotData
-                    'ToaOverflow',  # 7 = ToaOverflow
-                    'ToaData',      # 8 = ToaData
-                    'Hit',          # 9 = Hit
-                    'Sof',          # 10 = Sof
-                ])
+        self.count     = 0
+        self.dropCount = 0
+        self.printMode = printMode
+        self.hitFilter = hitFilter
+        self.summaryInterval = summaryInterval
+        self.decoder   = FrameDecoder()
+        if printMode not in ['sync', 'full', 'summary']:
+            raise ValueError(f'printMode must be either [sync,full,summary], got {printMode}')
+        # CSV dump, one file per channel opened on demand
+        self.exporter = exporter if exporter is not None else (CsvExporter() if cvsDump else None)
+
+        # Background printing thread
+        self._queue  = queue.Queue(maxsize=queueSize)
+        self._thread = None
+        if printMode != 'sync':
+            self._running = True
+            self._thread  = threading.Thread(target=self._printLoop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # Print what is still queued and stop the background thread
+        if self._thread is not None:
+            self._running = False
+            self._thread.join()
+            self._thread = None
+        if self.exporter is not None:
+            self.exporter.flush()
 
     # Method which is called when a frame is received
     def _acceptFrame(self,frame):
 
         # First it is good practice to hold a lock on the frame data.
         with frame.lock():
-            eventFrame = ParseFrame(frame)
-
-            # Print out the event
-            header_still_needs_to_be_printed = True
-            for i in range( len(eventFrame.pixValue) ):
-                pixel = eventFrame.pixValue[i]
-                pixIndex = pixel.PixelIndex
-
-                #if pixel.ToaOverflow != 1: #make sure this pixel is worth printing
-                if (pixel.Hit != 0) and (pixel.ToaData != 0x7F): #make sure this pixel is worth printing
-                    if header_still_needs_to_be_printed: #print the header only once per pixel
-                        print('FPGA {:#}'.format( frame.getChannel() ) +
-                              ', payloadSize(Bytes) {:#}'.format( frame.getPayload() ) +
-                              ', FormatVersion {:#}'.format(eventFrame.FormatVersion) +
-                              ', PixReadIteration {:#}'.format(eventFrame.PixReadIteration) +
-                              ', ReadoutSize {:#}'.format(eventFrame.ReadoutSize) +
-                              ', DropTrigCnt 0x{:X}'.format(eventFrame.dropTrigCnt) +
-                              ', SeqCnt {:#}'.format(eventFrame.SeqCnt) +
-                              ', Timestamp {:#}'.format( eventFrame.Timestamp ) )
-                        print('    Pixel : TotOverflow | TotData | ToaOverflow | ToaData | Hit | Sof')
-                        header_still_needs_to_be_printed = False
-
-                    print('    {:>#5} | {:>#11} | {:>#7} | {:>#11} | {:>#7} | {:>#3} | {:>#3}'.format(
-                        pixIndex,
-                        pixel.TotOverflow,
-                        pixel.TotData,
-                        pixel.ToaOverflow,
-                        pixel.ToaData,
-                        pixel.Hit,
-                        pixel.Sof)
-                    )
-
-                # Check if dumping to .CVS file
-                if self.cvsDump:
-                    self.writer[frame.getChannel()].writerow([
-                        '0x%016X'%eventFrame.Timestamp,  # 0 = Timestamp
-                        eventFrame.SeqCnt,     # 1 = SeqCnt
-                        eventFrame.TrigCnt,    # 2 = TrigCnt
-                        eventFrame.dropTrigCnt,# 3 = DropTrigCnt
-                        pixIndex,           # 4 = pixIndex
-                        pixel.TotOverflow,  # 5 = TotOverflow
-                        pixel.TotData,      # 6 = TotData
-                        pixel.ToaOverflow,  # 7 = ToaOverflow
-                        pixel.ToaData,      # 8 = ToaData
-                        pixel.Hit,          # 9 = Hit
-                        pixel.Sof,          # 10 = Sof
-                    ])
-
-            self.count += 1
-#################################################################
+            self.acceptEvent(ParseFrame(frame, self.decoder))
+
+    # Method which is called with every decoded frame
+    def acceptEvent(self, eventFrame):
+        pix = eventFrame.pixArray
+
+        # Select the pixels worth printing
+        printMask = self.hitFilter.mask(pix)
+
+        if self.printMode == 'sync':
+            self._printEvent(self._makeEvent(eventFrame, printMask))
+        else:
+            # Copy out of the decoder buffers and hand over to the printing thread
+            try:
+                self._queue.put_nowait(self._makeEvent(eventFrame, printMask))
+            except queue.Full:
+                self.dropCount += 1
+
+        # Check if dumping to .CVS file
+        if self.exporter is not None:
+            self.exporter.writeEvent(eventFrame.Channel, eventFrame)
+
+        self.count += 1
+
+    def _makeEvent(self, eventFrame, printMask):
+        # Header values plus a copy of the printable hits
+        header = (eventFrame.Channel, eventFrame.PayloadSize, int(eventFrame.FormatVersion), int(eventFrame.PixReadIteration),
+                  int(eventFrame.ReadoutSize), int(eventFrame.dropTrigCnt), int(eventFrame.SeqCnt), int(eventFrame.Timestamp))
+        pix  = eventFrame.pixArray
+        hits = np.stack([getattr(pix, name)[printMask] for name in PixFields])
+        return (header, hits)
+
+    def _printEvent(self, event):
+        (channel, payloadSize, FormatVersion, PixReadIteration, ReadoutSize, dropTrigCnt, SeqCnt, Timestamp), hits = event
+        if hits.shape[1] == 0:
+            return
+        lines = ['FPGA {:#}'.format( channel ) +
+                 ', payloadSize(Bytes) {:#}'.format( payloadSize ) +
+                 ', FormatVersion {:#}'.format(FormatVersion) +
+                 ', PixReadIteration {:#}'.format(PixReadIteration) +
+                 ', ReadoutSize {:#}'.format(ReadoutSize) +
+                 ', DropTrigCnt 0x{:X}'.format(dropTrigCnt) +
+                 ', SeqCnt {:#}'.format(SeqCnt) +
+                 ', Timestamp {:#}'.format( Timestamp ),
+                 '    Pixel : TotOverflow | TotData | ToaOverflow | ToaData | Hit | Sof']
+        for PixelIndex, TotOverflow, TotData, ToaOverflow, ToaData, Hit, Sof in hits.T.tolist():
+            lines.append('    {:>#5} | {:>#11} | {:>#7} | {:>#11} | {:>#7} | {:>#3} | {:>#3}'.format(
+                PixelIndex, TotOverflow, TotData, ToaOverflow, ToaData, Hit, Sof))
+        print('\n'.join(lines))
+
+    def _printLoop(self):
+        events   = 0
+        hits     = np.zeros(32, dtype=np.int64)
+        drops    = self.dropCount
+        lastTime = time.time()
+        while self._running or not self._queue.empty():
+            try:
+                event = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                event = None
+
+            if event is not None:
+                if self.printMode == 'full':
+                    self._printEvent(event)
+                else:
+                    events += 1
+                    hits   += np.bincount(event[1][0], minlength=32)
+
+            now = time.time()
+            if (self.printMode == 'summary') and (now-lastTime >= self.summaryInterval):
+                dropCount = self.dropCount
+                print('Events/s {:.1f}, Drops {:#} (total {:#}), Hits per pixel: {}'.format(
+                    events/(now-lastTime), dropCount-drops, dropCount,
+                    ' '.join(f'{i}:{n}' for i, n in enumerate(hits.tolist()) if n > 0)))
+                events, drops, lastTime = 0, dropCount, now
+                hits[:] = 0
 
-# Class for Reading the Data from File
-class MyFileReader(rogue.interfaces.stream.Slave):
+#################################################################
 
-    def __init__(self):
+class HitDataReader(SlaveMonitor, rogue.interfaces.stream.Slave):
+    # Stores the hits selected by hitFilter (default Hit > 0) of every frame in a HitStore,
+    # tagged with the pixel index and the current scanPoint (set by the script for every
+    # scan step). If a StreamingStats is given, the TOA of the hits is also accumulated in it.
+    def __init__(self, stats=None, hitFilter=HitSelect):
         rogue.interfaces.stream.Slave.__init__(self)
-        self.HitData = []
-        self.HitDataTOTf_vpa = []
-        self.HitDataTOTf_tz = []
-        self.HitDataTOTc_vpa = []
-        self.HitDataTOTc_tz = []
-        self.HitDataTOTc_int1_vpa = []
-        self.HitDataTOTc_int1_tz = []
-        self.HitDataTOTf_vpa_temp = 0
-        self.HitDataTOTc_vpa_temp = 0
-        self.HitDataTOTf_tz_temp = 0
-        self.HitDataTOTc_tz_temp = 0
-        self.HitDataTOTc_int1_vpa_temp = 0
-        self.HitDataTOTc_int1_tz_temp = 0
+        self.decoder   = FrameDecoder()
+        self.hitFilter = hitFilter
+        self.hits      = HitStore()
+        self.stats     = stats
+        self.scanPoint = 0
 
     def _acceptFrame(self,frame):
         # First it is good practice to hold a lock on the frame data.
         with frame.lock():
-            eventFrame = ParseFrame(frame)
-            for i in range( len(eventFrame.pixValue) ):
-                dat = eventFrame.pixValue[i]
-
-                if (dat.Hit > 0) and (dat.ToaOverflow == 0):
-                    self.HitData.append(dat.ToaData)
-
-                if (dat.Hit > 0) and (dat.TotData != 0x1fc):
-                    self.HitDataTOTf_vpa_temp = ((dat.TotData >>  0) & 0x3) + dat.TotOverflow*math.pow(2,2)
-                    self.HitDataTOTc_vpa_temp = (dat.TotData >>  2) & 0x7F
-                    self.HitDataTOTc_int1_vpa_temp = (((dat.TotData >>  2) + 1) >> 1) & 0x3F
-                    self.HitDataTOTf_vpa.append(self.HitDataTOTf_vpa_temp)
-                    self.HitDataTOTc_vpa.append(self.HitDataTOTc_vpa_temp)
-                    self.HitDataTOTc_int1_vpa.append(self.HitDataTOTc_int1_vpa_temp)
-
-                if (dat.Hit > 0) and (dat.TotData != 0x1f8):
-                    self.HitDataTOTf_tz_temp = ((dat.TotData >>  0) & 0x7) + dat.TotOverflow*math.pow(2,3)
-                    self.HitDataTOTc_tz_temp = (dat.TotData >>  3) & 0x3F
-                    self.HitDataTOTc_int1_tz_temp = (((dat.TotData >>  3) + 1) >> 1) & 0x1F
-                    self.HitDataTOTf_tz.append(self.HitDataTOTf_tz_temp)
-                    self.HitDataTOTc_tz.append(self.HitDataTOTc_tz_temp)
-                    self.HitDataTOTc_int1_tz.append(self.HitDataTOTc_int1_tz_temp)
+            self.acceptEvent(ParseFrame(frame, self.decoder))
+
+    def acceptEvent(self, eventFrame):
+        self.addHits(eventFrame.pixArray, eventFrame.Channel)
+
+    def addHits(self, pix, channel=0):
+        hit = self.hitFilter.mask(pix)
+        if self.stats is not None:
+            toa = hit & (pix.ToaOverflow == 0)
+            self.stats.update(channel, pix.PixelIndex[toa], pix.ToaData[toa], scan=self.scanPoint)
+        self.hits.append(
+            PixelIndex  = pix.PixelIndex[hit],
+            TotOverflow = pix.TotOverflow[hit],
+            TotData     = pix.TotData[hit],
+            ToaOverflow = pix.ToaOverflow[hit],
+            ToaData     = pix.ToaData[hit],
+            ScanPoint   = self.scanPoint,
+        )
+
+    def clear(self):
+        self.hits.clear()
+
+    def _tot(self, mode):
+        # Table and TotIndex of the hits that hold a valid TOT for this layout
+        table = GetTotTable(mode)
+        index = (self.hits.column('TotOverflow').astype(np.uint16) << 9) | self.hits.column('TotData')
+        return table, index[table.Valid[index]]
+
+    # TOA of the hits without ToaOverflow
+    @property
+    def HitData(self):
+        return self.hits.column('ToaData')[self.hits.column('ToaOverflow') == 0]
+
+    @property
+    def HitDataTOTf_vpa(self):
+        table, index = self._tot('vpa')
+        return table.TOTf[index]
+
+    @property
+    def HitDataTOTc_vpa(self):
+        table, index = self._tot('vpa')
+        return table.TOTc[index]
+
+    @property
+    def HitDataTOTc_int1_vpa(self):
+        table, index = self._tot('vpa')
+        return table.TOTc_int1[index]
+
+    @property
+    def HitDataTOTf_tz(self):
+        table, index = self._tot('tz')
+        return table.TOTf[index]
+
+    @property
+    def HitDataTOTc_tz(self):
+        table, index = self._tot('tz')
+        return table.TOTc[index]
+
+    @property
+    def HitDataTOTc_int1_tz(self):
+        table, index = self._tot('tz')
+        return table.TOTc_int1[index]
 
 #################################################################
 
-# Class for Reading Data output by pixels
-class MyPixelReader(rogue.interfaces.stream.Slave):
+# Class for Reading the Data from File
+class MyFileReader(HitDataReader):
+    pass
 
-    def __init__(self):
-        rogue.interfaces.stream.Slave.__init__(self)
-        self.HitData = []
-        self.HitDataTOTf_vpa = []
-        self.HitDataTOTf_tz = []
-        self.HitDataTOTc_vpa = []
-        self.HitDataTOTc_tz = []
-        self.HitDataTOTc_int1_vpa = []
-        self.HitDataTOTc_int1_tz = []
-        self.HitDataTOTf_vpa_temp = 0
-        self.HitDataTOTc_vpa_temp = 0
-        self.HitDataTOTf_tz_temp = 0
-        self.HitDataTOTc_tz_temp = 0
-        self.HitDataTOTc_int1_vpa_temp = 0
-        self.HitDataTOTc_int1_tz_temp = 0
+#################################################################
 
-    def _acceptFrame(self,frame):
-        # First it is good practice to hold a lock on the frame data.
-        with frame.lock():
-            eventFrame = ParseFrame(frame)
-
-            for i in range( len(eventFrame.pixValue) ):
-                dat = eventFrame.pixValue[i]
-
-                if (dat.Hit > 0) and (dat.ToaOverflow == 0):
-                    self.HitData.append(dat.ToaData)
-
-                if (dat.Hit > 0) and (dat.TotData != 0x1fc):
-                    self.HitDataTOTf_vpa_temp = ((dat.TotData >>  0) & 0x3) + dat.TotOverflow*math.pow(2,2)
-                    self.HitDataTOTc_vpa_temp = (dat.TotData >>  2) & 0x7F
-                    self.HitDataTOTc_int1_vpa_temp = (((dat.TotData >>  2) + 1) >> 1) & 0x3F
-                    self.HitDataTOTf_vpa.append(self.HitDataTOTf_vpa_temp)
-                    self.HitDataTOTc_vpa.append(self.HitDataTOTc_vpa_temp)
-                    self.HitDataTOTc_int1_vpa.append(self.HitDataTOTc_int1_vpa_temp)
-
-                if (dat.Hit > 0) and (dat.TotData != 0x1f8):
-                    self.HitDataTOTf_tz_temp = ((dat.TotData >>  0) & 0x7) + dat.TotOverflow*math.pow(2,3)
-                    self.HitDataTOTc_tz_temp = (dat.TotData >>  3) & 0x3F
-                    self.HitDataTOTc_int1_tz_temp = (((dat.TotData >>  3) + 1) >> 1) & 0x1F
-                    self.HitDataTOTf_tz.append(self.HitDataTOTf_tz_temp)
-                    self.HitDataTOTc_tz.append(self.HitDataTOTc_tz_temp)
-                    self.HitDataTOTc_int1_tz.append(self.HitDataTOTc_int1_tz_temp)
+# Class for Reading Data output by pixels
+class MyPixelReader(HitDataReader):
+    pass
 
 #################################################################
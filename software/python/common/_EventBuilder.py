@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import heapq
+import threading
+import traceback
+import numpy as np
+
+import pyrogue as pr
+
+from common._DataFileReader import DataFile, SemChannelOffset
+
+#################################################################
+
+class BuiltEvent(object):
+    # One trigger seen by several FPGAs: fragments is {channel: EventValue}
+    def __init__(self, TrigCnt, Timestamp, fragments, complete):
+        self.TrigCnt   = TrigCnt
+        self.Timestamp = Timestamp
+        self.fragments = fragments
+        self.complete  = complete
+
+BuilderCounters = [
+    'Fragments',          # fragments received
+    'Events',             # events emitted
+    'IncompleteEvents',   # events emitted with fragments missing
+    'LateFragments',      # fragments that arrived after their event was emitted
+    'DuplicateFragments', # second fragment of the same channel and TrigCnt
+    'TimestampMismatch',  # fragments with the right TrigCnt but outside the Timestamp window
+    'UnknownChannel',     # fragments of a channel not in channels
+    'Resets',             # TrigCnt went backwards (new run), counted once per run
+]
+
+class EventBuilder(object):
+    '''
+    Merges the frames (fragments) of several FPGAs into global events keyed on TrigCnt.
+    A fragment only joins an event if its Timestamp is within window of the first
+    fragment of the event (window=None: TrigCnt only).
+
+    Events are emitted in TrigCnt order to the subscribers (objects with an
+    acceptEvent(builtEvent) method, or functions). An event is emitted as soon as it
+    is complete and older events are out; an incomplete event is emitted once every
+    channel has moved more than depth triggers past it, or when more than maxPending
+    events are waiting. A channel whose TrigCnt goes backwards (StartRun) starts a new
+    run for that channel: its next fragments are kept apart until the other channels
+    cross the run boundary too, the events of the previous run are completed in the
+    meantime and emitted before those of the new run.
+
+    Live, Top(buildEvents=True) feeds it from the EventDecoder of every FPGA (see
+    feedFrom), only while it has subscribers itself:
+        top.eventBuilder.subscribe(consumer)
+    From a file, see BuildFileEvents().
+    '''
+    def __init__(self, channels, window=None, depth=64, maxPending=4096):
+        self.channels     = sorted(int(ch) for ch in channels)
+        self.window       = window
+        self.depth        = depth
+        self.maxPending   = maxPending
+        self._lock        = threading.Lock()
+        self._subscribers = []
+        self._sources     = [] # (EventDecoder, feeder) pairs, subscribed while we have subscribers
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {name: 0 for name in BuilderCounters}
+            self._clear()
+
+    def _clear(self):
+        self._pending = {}   # (run, TrigCnt) -> {channel: EventValue}
+        self._heap    = []   # pending (run, TrigCnt), oldest first
+        self._last    = {ch: None for ch in self.channels}
+        self._run     = {ch: 0 for ch in self.channels}  # TrigCnt resets seen per channel
+        self._maxRun  = 0
+        self._emitted = None # (run, TrigCnt) of the last emitted event
+
+    def feedFrom(self, channel, decoder):
+        # The fragments of channel come from decoder (an EventDecoder). The builder only
+        # subscribes to it while it has subscribers, so an unused builder keeps the
+        # decoder idle (no frame copies or decoding).
+        feeder = lambda eventFrame: self.addFragment(channel, eventFrame)
+        with self._lock:
+            self._sources = self._sources + [(decoder, feeder)]
+            active = bool(self._subscribers)
+        if active:
+            decoder.subscribe(feeder)
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            sources = [] if self._subscribers else self._sources
+            self._subscribers = self._subscribers + [subscriber]
+        for decoder, feeder in sources:
+            decoder.subscribe(feeder)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            active = bool(self._subscribers)
+            self._subscribers = [s for s in self._subscribers if s is not subscriber]
+            sources = self._sources if (active and not self._subscribers) else []
+        for decoder, feeder in sources:
+            decoder.unsubscribe(feeder)
+
+    def acceptEvent(self, eventFrame):
+        # EventDecoder subscriber interface, for frames whose Channel is the FPGA index (files)
+        self.addFragment(eventFrame.Channel, eventFrame)
+
+    def addFragment(self, channel, eventFrame):
+        if not self._subscribers:
+            return
+        # Emit under the lock so that the events stay in order when several decoders feed in
+        with self._lock:
+            self._publish(self._add(int(channel), eventFrame))
+
+    def flush(self):
+        # Emit all pending events, complete or not (end of run or file)
+        with self._lock:
+            self._publish(self._drain(flushAll=True))
+
+    def _add(self, channel, eventFrame):
+        self.counters['Fragments'] += 1
+        if channel not in self._last:
+            self.counters['UnknownChannel'] += 1
+            return []
+        trig = int(eventFrame.TrigCnt)
+
+        # Every channel sends increasing TrigCnt until its counter is reset (new run)
+        last = self._last[channel]
+        if (last is not None) and (trig < last):
+            self._run[channel] += 1
+            if self._run[channel] > self._maxRun:
+                self._maxRun = self._run[channel]
+                self.counters['Resets'] += 1
+        self._last[channel] = trig
+        key = (self._run[channel], trig)
+
+        if (self._emitted is not None) and (key <= self._emitted):
+            self.counters['LateFragments'] += 1
+            return self._drain()
+
+        fragments = self._pending.get(key)
+        if fragments is None:
+            fragments = self._pending[key] = {}
+            heapq.heappush(self._heap, key)
+
+        if channel in fragments:
+            self.counters['DuplicateFragments'] += 1
+        elif fragments and (self.window is not None) and \
+                abs(int(eventFrame.Timestamp) - int(next(iter(fragments.values())).Timestamp)) > self.window:
+            self.counters['TimestampMismatch'] += 1
+        else:
+            fragments[channel] = eventFrame
+        return self._drain()
+
+    def _passed(self, run, trig):
+        # Every channel moved more than depth triggers past trig, or on to a later run
+        for ch, last in self._last.items():
+            if last is None:
+                return False
+            if (self._run[ch] == run) and (last - trig <= self.depth):
+                return False
+        return True
+
+    def _drain(self, flushAll=False):
+        out = []
+        while self._heap:
+            key       = self._heap[0]
+            run, trig = key
+            fragments = self._pending[key]
+            complete  = len(fragments) == len(self.channels)
+            if not (complete or flushAll or (len(self._pending) > self.maxPending) or self._passed(run, trig)):
+                break
+            heapq.heappop(self._heap)
+            del self._pending[key]
+            self._emitted = key
+            if not fragments:
+                continue
+            self.counters['Events'] += 1
+            if not complete:
+                self.counters['IncompleteEvents'] += 1
+            timestamp = int(fragments[min(fragments)].Timestamp)
+            out.append(BuiltEvent(trig, timestamp, dict(sorted(fragments.items())), complete))
+        return out
+
+    def _publish(self, events):
+        for event in events:
+            for subscriber in self._subscribers:
+                try:
+                    if hasattr(subscriber, 'acceptEvent'):
+                        subscriber.acceptEvent(event)
+                    else:
+                        subscriber(event)
+                except Exception:
+                    traceback.print_exc()
+
+def BuildFileEvents(path, channels=None, window=None, depth=64, chunkFrames=100000):
+    '''
+    Build the global events of a data file written by Top.dataWriter, where the
+    channel of a record is the FPGA index. Yields lists of BuiltEvent.
+    '''
+    with DataFile(path) as dataFile:
+        if channels is None:
+            hdr = dataFile.headers()
+            channels = np.unique(hdr.Channel[hdr.Channel < SemChannelOffset]).tolist()
+        events  = []
+        builder = EventBuilder(channels, window, depth)
+        builder.subscribe(events.append)
+
+        for batches in dataFile.iterate(chunkFrames=chunkFrames, channels=channels):
+            # Feed the fragments in the order they were written to the file
+            offsets = np.concatenate([batch.Offset for batch in batches.values()])
+            source  = np.concatenate([np.full(len(batch), ch) for ch, batch in batches.items()])
+            index   = np.concatenate([np.arange(len(batch)) for batch in batches.values()])
+            for i in np.argsort(offsets, kind='stable').tolist():
+                builder.addFragment(int(source[i]), batches[int(source[i])].event(int(index[i])))
+
+            if events:
+                yield list(events)
+                events.clear()
+
+        builder.flush()
+        if events:
+            yield list(events)
+
+#################################################################
+
+class EventBuilding(pr.Device):
+    '''
+    Counters of an EventBuilder, added by Top(buildEvents=True)
+    '''
+    def __init__(self,
+            builder,
+            name        = 'EventBuilding',
+            description = 'Cross-FPGA event builder counters',
+            **kwargs):
+
+        super().__init__(
+            name        = name,
+            description = description,
+            **kwargs)
+
+        self.builder = builder
+
+        for counter in BuilderCounters:
+            self.add(pr.LocalVariable(
+                name         = counter,
+                mode         = 'RO',
+                value        = 0,
+                localGet     = lambda counter=counter: self.builder.counters[counter],
+                pollInterval = 1,
+            ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Pending',
+            description  = 'Events waiting for fragments',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: len(self.builder._pending),
+            pollInterval = 1,
+        ))
+
+        @self.command(description='Emit all pending events')
+        def Flush():
+            self.builder.flush()
+
+        @self.command(description='Drop the pending events and reset the counters')
+        def CountReset():
+            self.builder.reset()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import threading
+import traceback
+
+import rogue
+
+from common._DataStreamReader import ParseFrame, PixFields
+from common._SlaveMonitor     import SlaveMonitor
+
+#################################################################
+
+class EventDecoder(SlaveMonitor, rogue.interfaces.stream.Slave):
+    '''
+    Decodes every frame once and fans the decoded EventValue out to all subscribers,
+    so the decoding cost does not depend on the number of consumers. A subscriber is
+    any object with an acceptEvent(eventFrame) method (PrintEventReader, HitDataReader,
+    HistogramReader, onlineEventDisplay, CsvExporter, ...) or a function(eventFrame):
+        top.eventDecoder[0].subscribe(feb.PrintEventReader())
+
+    The EventValue is shared by all subscribers: its arrays are read-only and own their
+    memory, so a subscriber may keep them. Frames are not decoded while nobody subscribed.
+
+    If channel is given, it replaces the stream channel in eventFrame.Channel: the live
+    streams of all the FPGAs arrive on channel 0, Top passes the FPGA index, which is
+    also the channel of that FPGA's frames in the data files.
+    '''
+    # SlaveMonitor: the fan-out is the consume part of _acceptFrame
+    _monitorConsume = '_publish'
+
+    def __init__(self, channel=None):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.channel      = channel
+        self._lock        = threading.Lock()
+        self._subscribers = []
+        self.count        = 0
+        self.errorCount   = 0
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = self._subscribers + [subscriber]
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscriber]
+
+    @property
+    def active(self):
+        # AsyncSlave does not copy the frames while nobody subscribed
+        return bool(self._subscribers)
+
+    def _acceptFrame(self, frame):
+        # The list is replaced, never modified, on (un)subscribe
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+
+        with frame.lock():
+            eventFrame = ParseFrame(frame)
+        if self.channel is not None:
+            eventFrame.Channel = self.channel
+        for name in PixFields:
+            getattr(eventFrame.pixArray, name).flags.writeable = False
+        self.count += 1
+        self._publish(eventFrame, subscribers)
+
+    def _publish(self, eventFrame, subscribers):
+        for subscriber in subscribers:
+            try:
+                if hasattr(subscriber, 'acceptEvent'):
+                    subscriber.acceptEvent(eventFrame)
+                else:
+                    subscriber(eventFrame)
+            except Exception:
+                # One failing consumer does not starve the others
+                self.errorCount += 1
+                traceback.print_exc()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import time
+import struct
+import threading
+
+import rogue
+import pyrogue as pr
+
+from common._FrameGenerator import FrameGenerator, FrameSource
+from common._SlaveMonitor   import SlaveMonitor
+
+#################################################################
+
+# Register addresses (see Fpga, Altiroc and the Altiroc* devices)
+AxiVersionFpgaVersion = 0x00000000
+AxiVersionEfuse       = 0x00000408
+AsicBase              = 0x01000000
+CalPulseBase          = AsicBase + 0x00020000
+TrigBase              = AsicBase + 0x00030000
+SlowControlBase       = AsicBase + 0x00040000
+ReadoutBase           = AsicBase + 0x00060000
+
+CalPulseDelayWidth    = CalPulseBase + 0x00  # CalPulseDelay[15:0], CalPulseWidth[31:16]
+CalPulseCount         = CalPulseBase + 0x04
+CalPulseStart         = CalPulseBase + 0x08
+CalPulseContinuous    = CalPulseBase + 0x0C
+TrigCalPulseTrigCnt   = TrigBase + 0x10
+TrigBncExtTrigCnt     = TrigBase + 0x14
+TrigTriggerCnt        = TrigBase + 0x20
+TrigTimeCounter       = TrigBase + 0x28      # 64 bits
+TrigEnables           = TrigBase + 0x48      # EnCalPulseTrig[0], EnBncExtTrig[1]
+TrigEnableReadout     = TrigBase + 0x80
+TrigCountReset        = TrigBase + 0xFC
+ShiftRegSize          = SlowControlBase + 0xFF8
+ReadoutSeqCnt         = ReadoutBase + 0x0C
+ReadoutReadoutSize    = ReadoutBase + 0xF4
+ReadoutSeqCntReset    = ReadoutBase + 0xFC
+
+# SRPv3 opcodes
+SrpRead, SrpWrite, SrpPostedWrite, SrpNull = range(4)
+
+TimeCounterHz = 160.0e6
+
+#################################################################
+
+class FebEmulator(object):
+    '''
+    Software stand-in for an FEB: the register space used by Top/Fpga/Altiroc and a
+    data stream of synthetic frames (FrameGenerator). Registers without a model read
+    back what was last written (zero at start, which also reads as Pll locked).
+
+    Triggers are modelled as in the firmware: CalPulse.Start fires CalPulseCount+1 cal
+    pulses, CalPulse.Continuous keeps firing them every (CalPulseDelay+1)*25 ns and
+    EnBncExtTrig adds external triggers at extTrigRate. Cal pulses only trigger with
+    EnCalPulseTrig set and triggers only send a frame with EnableReadout set. The
+    trigger rate is limited to maxRate, frames are sent every updatePeriod seconds.
+    '''
+    def __init__(self, generator=None, asicVersion=2, extTrigRate=1000.0, maxRate=100.0e3, updatePeriod=0.01):
+        self.generator    = generator if generator is not None else FrameGenerator()
+        self.source       = FrameSource(self.generator)
+        self.extTrigRate  = extTrigRate
+        self.maxRate      = maxRate
+        self.updatePeriod = updatePeriod
+        self._lock        = threading.Lock()
+        self._mem         = {}
+        self._t0          = time.time()
+        self._pending     = 0.0  # cal pulses still to be fired by Start
+        self.frameCount   = 0
+
+        self._setWord(AxiVersionFpgaVersion, 0x40000000)
+        self._setWord(AxiVersionEfuse, 0x00004EA9)
+        self._setWord(ShiftRegSize, 992 if (asicVersion >= 3) else 965)
+        self._setWord(ReadoutReadoutSize, self.generator.readoutSize)
+
+        self._running = True
+        self._thread  = threading.Thread(target=self._triggerLoop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+
+    # Register memory, 32-bit words
+    def _word(self, address):
+        return self._mem.get(address & ~0x3, 0)
+
+    def _setWord(self, address, value):
+        self._mem[address & ~0x3] = value & 0xFFFFFFFF
+
+    def _timeCounter(self):
+        return int((time.time()-self._t0)*TimeCounterHz) & 0xFFFFFFFFFFFFFFFF
+
+    def read(self, address, size):
+        with self._lock:
+            timeCounter = self._timeCounter()
+            self._setWord(TrigTimeCounter,   timeCounter)
+            self._setWord(TrigTimeCounter+4, timeCounter >> 32)
+            self._setWord(ReadoutSeqCnt, self.generator.SeqCnt)
+            first = address & ~0x3
+            words = [self._word(a) for a in range(first, address+size, 4)]
+        data = struct.pack(f'<{len(words)}I', *words)
+        return data[address-first:address-first+size]
+
+    def write(self, address, data):
+        with self._lock:
+            first = address & ~0x3
+            last  = (address+len(data)+3) & ~0x3
+            buf   = bytearray(struct.pack(f'<{(last-first)>>2}I', *[self._word(a) for a in range(first, last, 4)]))
+            buf[address-first:address-first+len(data)] = data
+            for i, value in enumerate(struct.unpack(f'<{len(buf)>>2}I', buf)):
+                self._setWord(first+4*i, value)
+                self._written(first+4*i, value)
+
+    def _written(self, address, value):
+        # Side effects of register writes (command registers)
+        if (address == CalPulseStart) and (value & 0x1):
+            self._pending += (self._word(CalPulseCount) & 0xFFFF) + 1
+        elif (address == TrigCountReset) and (value & 0x1):
+            for counter in range(TrigBase, TrigBase+0x28, 4):
+                self._setWord(counter, 0)
+            self.generator.TrigCnt     = 0
+            self.generator.dropTrigCnt = 0
+        elif (address == ReadoutSeqCntReset) and (value & 0x1):
+            self.generator.SeqCnt = 0
+        elif address == ReadoutReadoutSize:
+            self.generator.readoutSize = value & 0x1F
+
+    def _trigger(self, count, counter):
+        # count triggers from one source: count them and send their frames
+        if count <= 0:
+            return
+        self._setWord(counter, self._word(counter) + count)
+        self._setWord(TrigTriggerCnt, self._word(TrigTriggerCnt) + count)
+        if self._word(TrigEnableReadout) & 0x1:
+            self.generator.TrigCnt   = self._word(TrigTriggerCnt) - count
+            self.generator.Timestamp = self._timeCounter()
+            payloads = self.generator.payloads(count)
+            self.frameCount += count
+            return payloads
+        return None
+
+    def _triggerLoop(self):
+        last  = time.time()
+        carry = {TrigCalPulseTrigCnt: 0.0, TrigBncExtTrigCnt: 0.0}
+        while self._running:
+            time.sleep(self.updatePeriod)
+            now  = time.time()
+            dt   = now - last
+            last = now
+            sends = []
+            with self._lock:
+                enables = self._word(TrigEnables)
+                period  = ((self._word(CalPulseDelayWidth) & 0xFFFF)+1)*25.0e-9
+                budget  = self.maxRate*dt
+
+                # Cal pulses: the remaining Start trains, then Continuous
+                pulses = min(self._pending, dt/period, budget)
+                self._pending -= pulses
+                if self._word(CalPulseContinuous) & 0x1:
+                    pulses = min(budget, pulses + dt/period)
+                carry[TrigCalPulseTrigCnt] += pulses if (enables & 0x1) else 0.0
+
+                if enables & 0x2:
+                    carry[TrigBncExtTrigCnt] += min(self.extTrigRate*dt, budget)
+
+                for counter in carry:
+                    count = int(carry[counter])
+                    carry[counter] -= count
+                    payloads = self._trigger(count, counter)
+                    if payloads:
+                        sends.append(payloads)
+
+            # Send outside of the lock so that register access is not blocked
+            for payloads in sends:
+                for payload in payloads:
+                    self.source.sendPayload(payload)
+
+#################################################################
+
+class SrpV3Emulator(SlaveMonitor, rogue.interfaces.stream.Master, rogue.interfaces.stream.Slave):
+    # SRPv3 register access server on top of a FebEmulator register space
+    def __init__(self, emulator):
+        rogue.interfaces.stream.Master.__init__(self)
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.emulator = emulator
+
+    def _acceptFrame(self, frame):
+        with frame.lock():
+            request = bytearray(frame.getPayload())
+            frame.read(request, 0)
+        if len(request) < 20:
+            return
+
+        header  = struct.unpack_from('<5I', request, 0)
+        opcode  = (header[0] >> 8) & 0x3
+        address = (header[3] << 32) | header[2]
+        size    = header[4] + 1
+
+        status = 0
+        if opcode == SrpRead:
+            data = self.emulator.read(address, size)
+        elif opcode in [SrpWrite, SrpPostedWrite]:
+            data = bytes(request[20:20+size])
+            if len(data) != size:
+                status = 0x1
+            else:
+                self.emulator.write(address, data)
+            if opcode == SrpPostedWrite:
+                return
+        else:
+            data = b''
+
+        # Response: the request header, the data read or written, then the status word
+        response = bytearray(request[:20]) + data + struct.pack('<I', status)
+        out = self._reqFrame(len(response), True)
+        out.write(response, 0)
+        self._sendFrame(out)
+
+#################################################################
+
+class FebEmulatorServer(object):
+    '''
+    Serves a FebEmulator on the ports used by Top(ip=['simulation']):
+    SRPv3 on port (9000, 9001) and the data stream on port (9002, 9003).
+        server = feb.FebEmulatorServer(feb.FebEmulator(feb.FrameGenerator(occupancy=0.2)))
+    '''
+    def __init__(self, emulator, host='127.0.0.1', srpPort=9000, dataPort=9002):
+        self.emulator   = emulator
+        self.srp        = SrpV3Emulator(emulator)
+        self.srpServer  = rogue.interfaces.stream.TcpServer(host, srpPort)
+        self.dataServer = rogue.interfaces.stream.TcpServer(host, dataPort)
+        pr.streamConnectBiDir(self.srp, self.srpServer)
+        pr.streamConnect(emulator.source, self.dataServer)
+
+    def stop(self):
+        self.emulator.stop()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import numpy as np
+
+import rogue
+
+#################################################################
+
+class FrameGenerator(object):
+    '''
+    Synthetic ALTIROC data frames with the layout decoded by ParseFrame:
+        word 0      : FormatVersion[11:0], PixReadIteration[20:12], ReadoutSize[31:27]
+        word 1, 2   : SeqCnt, TrigCnt
+        word 3, 4   : Timestamp[31:0], Timestamp[63:32]
+        word 5..    : (ReadoutSize+1)*(PixReadIteration+1) pixel data words
+        last word   : dropTrigCnt
+    Every readout iteration reads PixelIndex 0..ReadoutSize. A pixel is hit with
+    probability occupancy; its TOA and TOT are drawn from normal distributions
+    (clipped to the field) and overflow with toaOverflowRate/totOverflowRate. Pixels
+    without a hit read ToaData = 0x7F and TotData = 0x1FC. Every trigger is lost
+    with probability dropRate, which skips TrigCnt and increments dropTrigCnt.
+    SeqCnt, TrigCnt, Timestamp and dropTrigCnt carry over between calls.
+    '''
+    def __init__(self, readoutSize=24, pixReadIteration=0, occupancy=0.5,
+                 toaMean=64.0, toaSigma=4.0, totMean=200.0, totSigma=20.0,
+                 toaOverflowRate=0.0, totOverflowRate=0.0, dropRate=0.0,
+                 formatVersion=1, triggerPeriod=4000, seed=None):
+        self.readoutSize      = readoutSize
+        self.pixReadIteration = pixReadIteration
+        self.occupancy        = occupancy
+        self.toaMean          = toaMean
+        self.toaSigma         = toaSigma
+        self.totMean          = totMean
+        self.totSigma         = totSigma
+        self.toaOverflowRate  = toaOverflowRate
+        self.totOverflowRate  = totOverflowRate
+        self.dropRate         = dropRate
+        self.formatVersion    = formatVersion
+        self.triggerPeriod    = triggerPeriod  # Timestamp ticks between triggers
+        self.rng              = np.random.default_rng(seed)
+        self.SeqCnt           = 0
+        self.TrigCnt          = 0
+        self.Timestamp        = 0
+        self.dropTrigCnt      = 0
+
+    @property
+    def numPix(self):
+        return (self.readoutSize+1)*(self.pixReadIteration+1)
+
+    @property
+    def frameWords(self):
+        return 5 + self.numPix + 1
+
+    def _dataWords(self, shape):
+        rng = self.rng
+        hit = rng.random(shape) < self.occupancy
+        toa = np.clip(np.rint(rng.normal(self.toaMean, self.toaSigma, shape)), 0, 0x7E).astype(np.uint32)
+        tot = np.clip(np.rint(rng.normal(self.totMean, self.totSigma, shape)), 0, 0x1FB).astype(np.uint32)
+        toa = np.where(hit, toa, 0x7F)
+        tot = np.where(hit, tot, 0x1FC)
+        toaOverflow = (hit & (rng.random(shape) < self.toaOverflowRate)).astype(np.uint32)
+        totOverflow = (hit & (rng.random(shape) < self.totOverflowRate)).astype(np.uint32)
+        pixel = (np.arange(shape[1]) % (self.readoutSize+1)).astype(np.uint32)
+        return ((pixel << 24) | (totOverflow << 20) | (tot << 11) |
+                (toaOverflow << 10) | (toa << 3) | (hit.astype(np.uint32) << 2))
+
+    def generate(self, numFrames):
+        # Returns (words, offsets, payloadSize) of numFrames consecutive frames, the input of ParseFrames
+        words = np.zeros((numFrames, self.frameWords), dtype=np.uint32)
+
+        # Lost triggers advance TrigCnt and dropTrigCnt without a frame
+        lost      = self.rng.geometric(1.0-self.dropRate, numFrames) - 1 if self.dropRate > 0 else np.zeros(numFrames, dtype=np.int64)
+        dropTrig  = self.dropTrigCnt + np.cumsum(lost)
+        trigCnt   = self.TrigCnt + np.arange(numFrames) + np.cumsum(lost)
+        timestamp = np.uint64(self.Timestamp) + (trigCnt - self.TrigCnt + 1).astype(np.uint64)*np.uint64(self.triggerPeriod)
+
+        words[:,0] = (self.formatVersion & 0xFFF) | ((self.pixReadIteration & 0x1FF) << 12) | ((self.readoutSize & 0x1F) << 27)
+        words[:,1] = (self.SeqCnt + np.arange(numFrames)) & 0xFFFFFFFF
+        words[:,2] = trigCnt & 0xFFFFFFFF
+        words[:,3] = (timestamp & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+        words[:,4] = (timestamp >> np.uint64(32)).astype(np.uint32)
+        words[:,5:5+self.numPix] = self._dataWords((numFrames, self.numPix))
+        words[:,-1] = dropTrig & 0xFFFFFFFF
+
+        if numFrames > 0:
+            self.SeqCnt      += numFrames
+            self.TrigCnt      = int(trigCnt[-1]) + 1
+            self.Timestamp    = int(timestamp[-1])
+            self.dropTrigCnt  = int(dropTrig[-1])
+
+        offsets     = np.arange(numFrames, dtype=np.int64)*self.frameWords
+        payloadSize = np.full(numFrames, 4*self.frameWords, dtype=np.uint32)
+        return words.reshape(-1), offsets, payloadSize
+
+    def payloads(self, numFrames):
+        # List of numFrames frame payloads (bytes)
+        words, offsets, payloadSize = self.generate(numFrames)
+        data = words.tobytes()
+        size = 4*self.frameWords
+        return [data[i*size:(i+1)*size] for i in range(numFrames)]
+
+#################################################################
+
+def WriteDataFile(path, generators, numFrames, chunkFrames=10000):
+    '''
+    Write a rogue data file (same format as pr.utilities.fileio.StreamWriter) with
+    numFrames frames per channel; generators is {channel: FrameGenerator}. The
+    channels are interleaved frame by frame, as the FPGAs of a run would be.
+    '''
+    with open(path, 'wb') as f:
+        for start in range(0, numFrames, chunkFrames):
+            n = min(chunkFrames, numFrames-start)
+            records = []
+            for channel, generator in generators.items():
+                words, offsets, payloadSize = generator.generate(n)
+                header = np.zeros((n, 2), dtype=np.uint32)
+                header[:,0] = payloadSize + 4
+                header[:,1] = (channel & 0xFF) << 24
+                records.append(np.concatenate((header, words.reshape(n, -1)), axis=1))
+            # Interleave the channels: record i of every channel, then record i+1, ...
+            if len({r.shape[1] for r in records}) == 1:
+                f.write(np.stack(records, axis=1).tobytes())
+            else:
+                f.write(b''.join(r[i].tobytes() for i in range(n) for r in records))
+
+#################################################################
+
+class FrameSource(rogue.interfaces.stream.Master):
+    '''
+    Stream Master sending synthetic frames, e.g. to test readers without an FEB:
+        source = feb.FrameSource(feb.FrameGenerator(occupancy=0.2))
+        pr.streamConnect(source, reader)
+        source.send(10000)
+    '''
+    def __init__(self, generator):
+        rogue.interfaces.stream.Master.__init__(self)
+        self.generator = generator
+
+    def sendPayload(self, payload):
+        frame = self._reqFrame(len(payload), True)
+        frame.write(bytearray(payload), 0)
+        self._sendFrame(frame)
+
+    def send(self, numFrames, chunkFrames=10000):
+        for start in range(0, numFrames, chunkFrames):
+            for payload in self.generator.payloads(min(chunkFrames, numFrames-start)):
+                self.sendPayload(payload)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import numpy as np
+
+#################################################################
+
+# All the data word fields are at most 9 bits wide
+FieldTableSize = 0x200
+
+class HitFilter(object):
+    '''
+    Selection of pixel data words, evaluated as one boolean mask over a PixArray
+    (one frame or a whole EventBatch). Conditions left at None are not applied:
+        pixels      : PixelIndex values to keep
+        hit         : required Hit flag
+        toaOverflow : required ToaOverflow flag
+        totOverflow : required TotOverflow flag
+        toaRange    : inclusive (min, max) of ToaData
+        totRange    : inclusive (min, max) of TotData
+        sof         : Sof value(s) to keep
+        exclude     : {field: values} to drop, e.g. {'ToaData': [0x7F]}
+    Every condition on a set of values is compiled into a lookup table on the field,
+    so it costs a single gather. Filters combine with &, e.g. ToaSelect & HitFilter(pixels=[4]).
+    '''
+    def __init__(self, pixels=None, hit=None, toaOverflow=None, totOverflow=None,
+                 toaRange=None, totRange=None, sof=None, exclude=None):
+        self._tables = []  # (field, boolean table indexed by the field value)
+        self._ranges = []  # (field, min, max)
+
+        if pixels is not None:
+            self._keep('PixelIndex', pixels)
+        if hit is not None:
+            self._keep('Hit', [int(bool(hit))])
+        if toaOverflow is not None:
+            self._keep('ToaOverflow', [int(bool(toaOverflow))])
+        if totOverflow is not None:
+            self._keep('TotOverflow', [int(bool(totOverflow))])
+        if sof is not None:
+            self._keep('Sof', np.atleast_1d(sof))
+        if toaRange is not None:
+            self._ranges.append(('ToaData', int(toaRange[0]), int(toaRange[1])))
+        if totRange is not None:
+            self._ranges.append(('TotData', int(totRange[0]), int(totRange[1])))
+        for field, values in (exclude or {}).items():
+            table = np.ones(FieldTableSize, dtype=bool)
+            table[np.atleast_1d(values)] = False
+            self._tables.append((field, table))
+
+    def _keep(self, field, values):
+        table = np.zeros(FieldTableSize, dtype=bool)
+        table[np.asarray(values, dtype=np.int64)] = True
+        self._tables.append((field, table))
+
+    def __and__(self, other):
+        combined = HitFilter()
+        combined._tables = self._tables + other._tables
+        combined._ranges = self._ranges + other._ranges
+        return combined
+
+    def mask(self, pix):
+        mask = np.ones(len(pix.PixelIndex), dtype=bool)
+        for field, table in self._tables:
+            mask &= table[getattr(pix, field)]
+        for field, low, high in self._ranges:
+            value = getattr(pix, field)
+            mask &= (value >= low) & (value <= high)
+        return mask
+
+    def __call__(self, pix):
+        return self.mask(pix)
+
+#################################################################
+
+# Selections used by the readers
+AllSelect    = HitFilter()
+HitSelect    = HitFilter(hit=True)
+ToaSelect    = HitFilter(hit=True, toaOverflow=False)
+PrintSelect  = HitFilter(hit=True, exclude={'ToaData': [0x7F]})
+TotSelectVpa = HitFilter(hit=True, exclude={'TotData': [0x1fc]})
+TotSelectTz  = HitFilter(hit=True, exclude={'TotData': [0x1f8]})
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import numpy as np
+
+#################################################################
+
+# Default hit columns: 14 bytes per hit. ScanPoint holds the value of the scanned
+# setting (DAC code, delay, voltage, ...), so it is kept as a float64: exact for any
+# integer up to 2**53 and for negative or fractional scan values.
+HitColumns = [
+    ('PixelIndex',  np.uint8),
+    ('TotOverflow', np.uint8),
+    ('TotData',     np.uint16),
+    ('ToaOverflow', np.uint8),
+    ('ToaData',     np.uint8),
+    ('ScanPoint',   np.float64),
+]
+
+class HitStore(object):
+    '''
+    Append-only typed column store. Every column is a NumPy array that grows
+    geometrically; column(name) returns a view of the filled part.
+
+    snapshot() hands out read-only views without copying. Once a snapshot has
+    been taken, clear() switches to fresh buffers instead of overwriting the
+    old ones, so snapshots stay valid.
+    '''
+    def __init__(self, columns=HitColumns, capacity=4096):
+        self.columns   = list(columns)
+        self._capacity = capacity
+        self._size     = 0
+        self._shared   = False
+        self._data     = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.columns}
+
+    def __len__(self):
+        return self._size
+
+    def nbytes(self):
+        return sum(np.dtype(dtype).itemsize for name, dtype in self.columns)*self._size
+
+    def _grow(self, size):
+        capacity = self._capacity
+        while capacity < size:
+            capacity *= 2
+        for name, dtype in self.columns:
+            data = np.zeros(capacity, dtype=dtype)
+            data[:self._size] = self._data[name][:self._size]
+            self._data[name] = data
+        self._capacity = capacity
+        # The old buffers now only belong to the snapshots
+        self._shared = False
+
+    def append(self, **values):
+        # Append a batch of hits: one array (or scalar broadcast to the batch) per column
+        n = max(np.size(value) for value in values.values())
+        if n == 0:
+            return
+        if self._size+n > self._capacity:
+            self._grow(self._size+n)
+        for name, dtype in self.columns:
+            self._data[name][self._size:self._size+n] = values.get(name, 0)
+        self._size += n
+
+    def column(self, name):
+        return self._data[name][:self._size]
+
+    def snapshot(self):
+        # Read-only views of the current content, {name: array}
+        self._shared = True
+        views = {}
+        for name, dtype in self.columns:
+            views[name] = self._data[name][:self._size].view()
+            views[name].flags.writeable = False
+        return views
+
+    def clear(self):
+        if self._shared:
+            self._data   = {name: np.zeros(self._capacity, dtype=dtype) for name, dtype in self.columns}
+            self._shared = False
+        self._size = 0
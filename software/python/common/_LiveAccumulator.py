@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import time
+import threading
+import contextlib
+import collections
+import numpy as np
+
+import rogue
+
+from common._TotDecoding      import TotTableVpa, TotIndex
+from common._HitFilter        import ToaSelect
+from common._DataStreamReader import FrameDecoder, ParseFrame
+from common._SlaveMonitor     import SlaveMonitor
+
+#################################################################
+
+# Views of the live histograms
+LiveViews = ['Integrated', 'Window', 'Decay']
+
+class LiveSnapshot(object):
+    # Immutable view of the live histograms: {name: read-only array}
+    def __init__(self, histograms, generation, entries, timestamp, view='Integrated'):
+        self.histograms = histograms
+        self.generation = generation  # incremented by every reset
+        self.entries    = entries     # fill() calls since the last reset
+        self.timestamp  = timestamp
+        self.view       = view        # one of LiveViews
+
+    def __getitem__(self, name):
+        return self.histograms[name]
+
+class LiveAccumulator(object):
+    '''
+    Histograms filled by the stream thread and read by a display thread, without
+    either of them waiting on the other:
+      - fill() hands out a private pending buffer under a lock held only while
+        the increments are done
+      - snapshot() swaps the pending buffer with a zeroed spare one (O(1) under
+        the lock), merges it into the integrated histograms outside the lock and
+        publishes a new read-only LiveSnapshot
+      - reset() only flags the integrated histograms to be zeroed by the next
+        snapshot(), so it never races with a fill or a merge
+
+        acc = feb.LiveAccumulator({'toa': (25,128), 'hits': (5,5)})
+        with acc.fill() as hist:
+            np.add.at(hist['toa'], (PixelIndex, ToaData), 1)
+        snap = acc.snapshot()   # snap['toa'] stays valid and unchanged
+
+    The published view is selected by setView() (see LiveViews):
+      - 'Integrated': everything since the last reset
+      - 'Window': the last window seconds, from a ring of slices sub-histograms
+        of window/slices seconds each (the current one is partially filled)
+      - 'Decay': every entry weighted by exp(-age/decay)
+    All the views are kept up to date by every snapshot() with O(bins) array
+    operations on the merged delta, so the view can be switched at any time.
+    Without new fills, hasNewData still turns True in the 'Window' view when a slice
+    expires and in the 'Decay' view when the weights dropped by decayStep, so that an
+    idle board does not stay frozen on its last picture.
+    '''
+    def __init__(self, shapes, dtype=np.int64, view='Integrated', window=60.0, slices=20, decay=60.0, decayStep=0.05):
+        self.shapes     = dict(shapes)
+        self.dtype      = dtype
+        self._fillLock  = threading.Lock()
+        self._mergeLock = threading.Lock()
+        self._pending   = self._zeros()
+        self._spare     = self._zeros()
+        self._count     = 0      # fills in the pending buffer
+        self._reset     = False
+        self._changed   = False  # view changed since the last snapshot
+        self._integrated = self._zeros()
+        self._entries    = 0
+        self.generation  = 0
+        self.view        = 'Integrated'
+        self.window      = window
+        self.slices      = slices
+        self.decay       = decay
+        self.decayStep   = decayStep
+        self._clearWindow(time.time())
+        self._clearDecay(time.time())
+        self.setView(view)
+        self._published  = self._publish()
+
+    def _zeros(self, dtype=None):
+        return {name: np.zeros(shape, dtype=self.dtype if dtype is None else dtype) for name, shape in self.shapes.items()}
+
+    @contextlib.contextmanager
+    def fill(self):
+        with self._fillLock:
+            yield self._pending
+            self._count += 1
+
+    @property
+    def hasNewData(self):
+        if (self._count > 0) or self._reset or self._changed:
+            return True
+        # The old entries expire or fade without new fills
+        now = time.time()
+        if self.view == 'Window':
+            return (self._windowCount > 0) and ((now - self._sliceStart) >= self.window/self.slices)
+        if self.view == 'Decay':
+            return (self._decayMax > 1.0e-3) and ((now - self._decayTime) >= -self.decay*np.log(1.0-self.decayStep))
+        return False
+
+    def reset(self):
+        with self._fillLock:
+            for hist in self._pending.values():
+                hist[:] = 0
+            self._count = 0
+            self._reset = True
+
+    def setView(self, view=None, window=None, decay=None):
+        '''
+        Selects the published view and its parameters (None keeps the current value).
+        Changing window restarts the window view, changing decay only applies from now on.
+        '''
+        if (view is not None) and (view not in LiveViews):
+            raise ValueError(f'view must be either {LiveViews}, got {view}')
+        if (window is not None) and (window <= 0):
+            raise ValueError(f'window must be > 0, got {window}')
+        if (decay is not None) and (decay <= 0):
+            raise ValueError(f'decay must be > 0, got {decay}')
+        with self._mergeLock:
+            if view is not None:
+                self.view = view
+            if (window is not None) and (window != self.window):
+                self.window = window
+                self._clearWindow(time.time())
+            if decay is not None:
+                self.decay = decay
+            self._changed = True
+
+    def _clearWindow(self, now):
+        # Ring of the completed slices, the current slice and the sum over both (and their fill counts)
+        self._ring        = collections.deque()
+        self._ringCounts  = collections.deque()
+        self._slice       = self._zeros()
+        self._sliceCount  = 0
+        self._windowSum   = self._zeros()
+        self._windowCount = 0
+        self._sliceStart  = now
+
+    def _clearDecay(self, now):
+        self._decayed   = self._zeros(np.float64)
+        self._decayMax  = 0.0
+        self._decayTime = now
+
+    def _rotate(self, now):
+        # Close the slices that ended before now, dropping the ones out of the window
+        interval = self.window/self.slices
+        if (now - self._sliceStart) >= self.window:
+            self._clearWindow(now)
+            return
+        while (now - self._sliceStart) >= interval:
+            self._ring.append(self._slice)
+            self._ringCounts.append(self._sliceCount)
+            self._sliceCount  = 0
+            self._sliceStart += interval
+            if len(self._ring) >= self.slices:
+                oldest = self._ring.popleft()
+                self._windowCount -= self._ringCounts.popleft()
+                for name, hist in oldest.items():
+                    self._windowSum[name] -= hist
+                    hist[:] = 0
+                self._slice = oldest
+            else:
+                self._slice = self._zeros()
+
+    def _swap(self):
+        # The filled pending buffer, the stream thread continues in the spare one
+        with self._fillLock:
+            delta, self._pending, self._spare = self._pending, self._spare, None
+            count, self._count = self._count, 0
+            reset, self._reset = self._reset, False
+            self._changed = False
+        return delta, count, reset
+
+    def _merge(self, delta, count, reset, now):
+        # Called with _mergeLock held, outside of the fill lock
+        if reset:
+            for hist in self._integrated.values():
+                hist[:] = 0
+            self._entries    = 0
+            self.generation += 1
+            self._clearWindow(now)
+            self._clearDecay(now)
+        for name, hist in delta.items():
+            self._integrated[name] += hist
+        self._entries += count
+
+        self._rotate(now)
+        for name, hist in delta.items():
+            self._slice[name]     += hist
+            self._windowSum[name] += hist
+        self._sliceCount  += count
+        self._windowCount += count
+
+        weight = np.exp(-(now - self._decayTime)/self.decay)
+        self._decayTime = now
+        for name, hist in delta.items():
+            self._decayed[name] *= weight
+            self._decayed[name] += hist
+        self._decayMax = max([float(hist.max(initial=0)) for hist in self._decayed.values()] + [0.0])
+
+    def _publish(self, now=None):
+        source = {'Integrated': self._integrated, 'Window': self._windowSum, 'Decay': self._decayed}[self.view]
+        histograms = {}
+        for name, hist in source.items():
+            histograms[name] = hist.copy()
+            histograms[name].flags.writeable = False
+        self._published = LiveSnapshot(histograms, self.generation, self._entries,
+                                       time.time() if now is None else now, self.view)
+        return self._published
+
+    def _recycle(self, delta):
+        # The merged delta becomes the next spare buffer
+        for hist in delta.values():
+            hist[:] = 0
+        with self._fillLock:
+            self._spare = delta
+
+    def snapshot(self):
+        # Merge what was filled since the last call and publish it
+        with self._mergeLock:
+            now = time.time()
+            delta, count, reset = self._swap()
+            self._merge(delta, count, reset, now)
+            self._recycle(delta)
+            return self._publish(now)
+
+    def latest(self):
+        # Last published snapshot, without merging
+        return self._published
+
+#################################################################
+
+class LiveHistograms(SlaveMonitor, rogue.interfaces.stream.Slave):
+    '''
+    The histograms of the live display, without any plotting: TOA and TOT (binned
+    to tot_xbins) per pixel and the hit map of the xpixels*ypixels matrix, filled
+    into a LiveAccumulator. onlineEventDisplay renders them, LivePublisher sends
+    their snapshots to remote viewers:
+        hist = feb.LiveHistograms()
+        top.eventDecoder[0].subscribe(hist)
+    hitFilter selects the hits, by default ToaSelect (Hit and not ToaOverflow).
+    '''
+    def __init__(self, toa_xrange=(0,127), toa_xbins=128, toa_ybins=25, tot_xrange=(0,127), tot_xbins=128, tot_ybins=25,
+                 xpixels=5, ypixels=5, hitFilter=None):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.decoder   = FrameDecoder()
+        self.hitFilter = hitFilter if hitFilter is not None else ToaSelect
+        self.xpixels, self.ypixels = xpixels, ypixels
+        self.tot_binning_count = tot_xrange[1] / toa_xrange[1]
+        self.accumulator = LiveAccumulator({
+            'toa'  : (toa_ybins,toa_xbins),
+            'tot'  : (tot_ybins,tot_xbins),
+            'hits' : (ypixels,xpixels),
+        })
+
+    def _acceptFrame(self, frame):
+        with frame.lock():
+            self.fill(ParseFrame(frame, self.decoder))
+
+    def acceptEvent(self, eventFrame):
+        self.fill(eventFrame)
+
+    def fill(self, eventFrame):
+        pix = eventFrame.pixArray
+        hit_data = np.zeros(self.xpixels*self.ypixels, dtype=int)
+        valid = self.hitFilter.mask(pix)
+        PixelIndex = pix.PixelIndex[valid]
+        hit_data[PixelIndex] = pix.Hit[valid]
+        #scale down tot data so we can use 128 bins for tot and toa
+        HitDataTOTc = TotTableVpa.TOTc[TotIndex(pix)[valid]]
+        tot_bin = (HitDataTOTc/self.tot_binning_count).astype(int)
+        hits_data = np.reshape(hit_data, (self.ypixels,self.xpixels), order='F')
+        # Only the increments are done under the accumulator lock
+        with self.accumulator.fill() as hist:
+            np.add.at(hist['toa'], (PixelIndex, pix.ToaData[valid]), 1)
+            np.add.at(hist['tot'], (PixelIndex, tot_bin), 1)
+            hist['hits'] += hits_data
+
+    @property
+    def hasNewData(self):
+        return self.accumulator.hasNewData
+
+    def snapshot(self):
+        return self.accumulator.snapshot()
+
+    def reset(self):
+        self.accumulator.reset()
+
+    def setView(self, view=None, window=None, decay=None):
+        self.accumulator.setView(view, window, decay)
@@ -1,15 +1,135 @@
 import datetime
+import time
 import rogue
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
-matplotlib.use('QT5Agg')
+from matplotlib.collections import LineCollection
+from matplotlib.patches import Rectangle
+from matplotlib.transforms import Bbox
 import os
 import common as feb
 
 
-class onlineEventDisplay(rogue.interfaces.stream.Slave):
+def _niceCeil(value):
+    # Smallest 1-2-5 step >= value
+    if value <= 0:
+        return 1
+    exp = 10.0**np.floor(np.log10(value))
+    for mant in (1, 2, 5, 10):
+        if mant*exp >= value:
+            return mant*exp
+
+def _niceFloor(value):
+    # Largest 1-2-5 step <= value (0 for non-positive values)
+    if value <= 0:
+        return 0
+    exp = 10.0**np.floor(np.log10(value))
+    for mant in (5, 2, 1):
+        if mant*exp <= value:
+            return mant*exp
+
+def ColorLimits(data):
+    '''
+    Color limits of an image rounded out to 1-2-5 steps, so that they (and the
+    colorbar) only change when the data range grows past a step
+    '''
+    return (_niceFloor(float(np.amin(data))), _niceCeil(float(np.amax(data))))
+
+def GridLines(ax, nx, ny, **kwargs):
+    '''
+    White separators between the bins of an image, as a single artist that can be
+    drawn over the image (the minor axis grid is part of the static background)
+    '''
+    x = np.arange(nx+1)-.5
+    y = np.arange(ny+1)-.5
+    segments  = [[(xi, y[0]), (xi, y[-1])] for xi in x]
+    segments += [[(x[0], yi), (x[-1], yi)] for yi in y]
+    return ax.add_collection(LineCollection(segments, **kwargs), autolim=False)
+
+
+class BlitRenderer(object):
+    '''
+    Refreshes the images of a figure by blitting: the static part (axes, ticks, labels,
+    colorbars) is rendered once and cached, each refresh only restores it and draws the
+    image artists and their overlays. When the color limits of an image change only its
+    colorbar is redrawn into the cached background; the whole figure is only drawn at
+    the first refresh and when the canvas is resized.
+
+        renderer = BlitRenderer(fig, [(im, cbar, [grid]), ...])
+        renderer.render([data, ...])
+    '''
+    def __init__(self, fig, images):
+        self.fig        = fig
+        self.images     = images
+        self.fullDraws  = 0
+        self.cbarDraws  = 0
+        self.blits      = 0
+        self._clims     = [None for i in images]
+        self._background = None
+        for im, cbar, overlays in self.images:
+            im.set_animated(True)
+            for artist in overlays:
+                artist.set_animated(True)
+        self.fig.canvas.mpl_connect('draw_event', self._onDraw)
+
+    def _drawImages(self):
+        for im, cbar, overlays in self.images:
+            im.axes.draw_artist(im)
+            for artist in overlays:
+                im.axes.draw_artist(artist)
+
+    def _onDraw(self, event):
+        # Every full draw (ours, resize, savefig) refreshes the cached background
+        canvas = self.fig.canvas
+        if canvas.is_saving() or not hasattr(canvas, 'copy_from_bbox'):
+            return
+        self._background = canvas.copy_from_bbox(self.fig.bbox)
+        self._drawImages()
+
+    def _redrawColorbars(self, cbars):
+        # Erase the old colorbars (ticks included) in the background and draw the new ones
+        canvas   = self.fig.canvas
+        renderer = canvas.get_renderer()
+        canvas.restore_region(self._background)
+        for cbar, oldBbox in cbars:
+            bbox  = Bbox.union([oldBbox, cbar.ax.get_tightbbox(renderer)])
+            # A subfigure is transparent, erase with the color of the figure it is drawn in
+            patch = Rectangle((bbox.x0, bbox.y0), bbox.width, bbox.height, transform=None,
+                              facecolor=self.fig.figure.get_facecolor(), edgecolor='none')
+            patch.set_figure(self.fig.figure)
+            patch.draw(renderer)
+            cbar.ax.draw(renderer)
+        self._background = canvas.copy_from_bbox(self.fig.bbox)
+
+    def render(self, arrays):
+        canvas   = self.fig.canvas
+        cbars    = []
+        for i, ((im, cbar, overlays), data) in enumerate(zip(self.images, arrays)):
+            im.set_data(data)
+            clim = ColorLimits(data)
+            if clim != self._clims[i]:
+                self._clims[i] = clim
+                if self._background is not None:
+                    cbars.append((cbar, cbar.ax.get_tightbbox(canvas.get_renderer())))
+                im.set_clim(*clim)
+
+        if self._background is None:
+            self.fullDraws += 1
+            canvas.draw()
+        else:
+            if cbars:
+                self.cbarDraws += 1
+                self._redrawColorbars(cbars)
+            self.blits += 1
+            canvas.restore_region(self._background)
+            self._drawImages()
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+
+class onlineEventDisplay(feb.SlaveMonitor, rogue.interfaces.stream.Slave):
     '''
     Python 3 compatible
     Requires numpy, matplotlib, datetime, os, shutil packages
@@ -66,7 +186,7 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
     '''
     def __init__(self, plot_title='Live Display', toa_xrange=(0,127), toa_yrange=(0,24), toa_xbins=128, toa_ybins=25,
                  tot_xrange=(0,127), tot_yrange=(0,24), tot_xbins=128, tot_ybins=25,
-                 xpixels=5, ypixels=5, font_size=6, fig_size=(15,8), submitDir='./', overwrite=False):
+                 xpixels=5, ypixels=5, font_size=6, fig_size=(15,8), submitDir='./', overwrite=False, hitFilter=None, backend='QT5Agg', fig=None):
         '''
         To initialize:
         myObject = onlineEventDisplay(TOA_range_of_bit_values like (0,127), TOA_range_of_number_of_pixels like (0,24),
@@ -83,9 +203,19 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
             1. Large :  Font Size = 8, Figure Size = (30,15)
             2. Medium:  Font Size = 6, Figure Size = (15,8)
             3. Small :  Font Size = 4, Figure Size = (10,6)
+
+        hitFilter (feb.HitFilter) selects the displayed hits, by default feb.ToaSelect (Hit and not ToaOverflow)
+
+        backend is the matplotlib backend, selected here rather than when common is imported so that
+        headless nodes (feb.LiveHistograms + feb.LivePublisher) never load Qt
+
+        fig is an existing figure or subfigure to draw into instead of a new figure (see LiveDisplayManager),
+        which then also takes care of drawing it
         '''
         rogue.interfaces.stream.Slave.__init__(self)
-        self.has_new_data = False
+        if backend is not None:
+            matplotlib.use(backend)
+        self.decoder = feb.FrameDecoder()
         self.toa_xrange, self.toa_yrange, self.toa_xbins, self.toa_ybins = toa_xrange, toa_yrange, toa_xbins,toa_ybins
         self.tot_xrange, self.tot_yrange, self.tot_xbins, self.tot_ybins = tot_xrange, tot_yrange, tot_xbins,tot_ybins
         self.xpixels, self.ypixels, self.submitDir, self.overwrite = xpixels, ypixels, submitDir, overwrite
@@ -104,15 +234,22 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
             else:
                 print ("Successfully created the directory %s" % self.submitDir)
 
-        self.toa_array = np.zeros((toa_ybins,toa_xbins), dtype=int)
-        self.tot_array = np.zeros((tot_ybins,tot_xbins), dtype=int)
-        self.hits_toa_array = np.zeros((ypixels,xpixels), dtype=int)
-        self.hits_tot_array = np.zeros((ypixels,xpixels), dtype=int)
+        # Filled from the stream thread, read as snapshots by the display thread
+        self.histograms = feb.LiveHistograms(toa_xrange, toa_xbins, toa_ybins, tot_xrange, tot_xbins, tot_ybins,
+                                             xpixels, ypixels, hitFilter)
+        self.hitFilter   = self.histograms.hitFilter
+        self.accumulator = self.histograms.accumulator
         plt.rcParams.update({'font.size': font_size})
 #         plt.ion()
 
-        self.fig = plt.figure(num=plot_title, figsize=fig_size, dpi=100)
-        self.gs = gridspec.GridSpec(6, 16)
+        if fig is None:
+            self.fig = plt.figure(num=plot_title, figsize=fig_size, dpi=100)
+            self.gs = gridspec.GridSpec(6, 16)
+        else:
+            # No tight_layout() in a subfigure: fixed margins for the tick labels and colorbars
+            self.fig = fig
+            self.fig.suptitle(plot_title)
+            self.gs = self.fig.add_gridspec(6, 16, left=0.06, right=0.98, bottom=0.1, top=0.92, wspace=1.0, hspace=2.5)
 
         self.ax = self.fig.add_subplot(self.gs[:3, :14])
         self.ax.set_title('TOA')
@@ -129,10 +266,7 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
                  rotation_mode="anchor")
         for edge, spine in self.ax.spines.items():
             spine.set_visible(False)
-        self.ax.set_xticks(np.arange(self.toa_xbins+1)-.5, minor=True)
-        self.ax.set_yticks(np.arange(self.toa_ybins+1)-.5, minor=True)
-        self.ax.grid(which="minor", color="w", linestyle='-', linewidth=1)
-        self.ax.tick_params(which="minor", bottom=False, left=False)
+        self.grid = GridLines(self.ax, self.toa_xbins, self.toa_ybins, colors="w", linestyles='-', linewidths=1)
 
         self.ax2 = self.fig.add_subplot(self.gs[2:5, 14:])
         self.ax2.set_title('TOA - Hits')
@@ -147,10 +281,7 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
         self.ax2.set_yticklabels(np.linspace(start=0,stop=self.ypixels-1,num=self.ypixels,dtype=int))
         for edge, spine in self.ax2.spines.items():
             spine.set_visible(False)
-        self.ax2.set_xticks(np.arange(self.xpixels+1)-.5, minor=True)
-        self.ax2.set_yticks(np.arange(self.ypixels+1)-.5, minor=True)
-        self.ax2.grid(which="minor", color="w", linestyle='-', linewidth=3)
-        self.ax2.tick_params(which="minor", bottom=False, left=False)
+        self.grid2 = GridLines(self.ax2, self.xpixels, self.ypixels, colors="w", linestyles='-', linewidths=3)
 
         self.ax1 = self.fig.add_subplot(self.gs[3:, :14])
         self.ax1.set_title('TOT')
@@ -167,25 +298,53 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
                  rotation_mode="anchor")
         for edge, spine in self.ax1.spines.items():
             spine.set_visible(False)
-        self.ax1.set_xticks(np.arange(self.tot_xbins+1)-.5, minor=True)
-        self.ax1.set_yticks(np.arange(self.tot_ybins+1)-.5, minor=True)
-        self.ax1.grid(which="minor", color="w", linestyle='-', linewidth=1)
-        self.ax1.tick_params(which="minor", bottom=False, left=False)
-
-        self.fig.tight_layout()
-        self.fig.canvas.draw()
-        plt.pause(0.000001)
-        self.fig.canvas.flush_events()
+        self.grid1 = GridLines(self.ax1, self.tot_xbins, self.tot_ybins, colors="w", linestyles='-', linewidths=1)
+
+        # Only the images (and their grids) are redrawn on refresh
+        self.renderer = BlitRenderer(self.fig, [
+            (self.im,  self.cbar,  [self.grid]),
+            (self.im1, self.cbar1, [self.grid1]),
+            (self.im2, self.cbar2, [self.grid2]),
+        ])
+        if fig is None:
+            self.fig.tight_layout()
+            self.fig.canvas.draw()
+            plt.pause(0.000001)
+            self.fig.canvas.flush_events()
+
+    # Integrated arrays of the last refresh (read-only)
+    @property
+    def toa_array(self):
+        return self.accumulator.latest()['toa']
+
+    @property
+    def tot_array(self):
+        return self.accumulator.latest()['tot']
+
+    @property
+    def hits_toa_array(self):
+        return self.accumulator.latest()['hits']
+
+    @property
+    def has_new_data(self):
+        return self.accumulator.hasNewData
 
     def reset(self):
         '''
         To reset, or zero out, the stored arrays that integrate the number of hits and TOT/TOA values recorded:
             myObject.reset()
+        The display is cleared at its next refresh.
         '''
-        self.toa_array = np.zeros((self.toa_ybins,self.toa_xbins), dtype=int)
-        self.tot_array = np.zeros((self.tot_ybins,self.tot_xbins), dtype=int)
-        self.hits_toa_array = np.zeros((self.ypixels,self.xpixels), dtype=int)
-        self.refreshDisplay()
+        self.accumulator.reset()
+
+    def setView(self, view=None, window=None, decay=None):
+        '''
+        To select the displayed histograms (feb.LiveViews), from the next refresh on:
+            myObject.setView('Window', window=60.0)   # the last 60 seconds
+            myObject.setView('Decay', decay=30.0)     # exponential decay, 30 seconds time constant
+            myObject.setView('Integrated')            # since the last reset
+        '''
+        self.histograms.setView(view, window, decay)
 
     def snapshot(self):
         '''
@@ -207,59 +366,110 @@ class onlineEventDisplay(rogue.interfaces.stream.Slave):
 
 
     def _acceptFrame(self,frame):
-        snap=False
-        instant=False
         # First it is good practice to hold a lock on the frame data.
         with frame.lock():
-            eventFrame = feb.ParseFrame(frame)
-
-            hit_data = np.zeros(self.xpixels*self.ypixels, dtype=int)
-            for i in range( len(eventFrame.pixValue) ):
-                pixel = eventFrame.pixValue[i]
-                if pixel.Hit and not pixel.ToaOverflow:
-                    hit_data[pixel.PixelIndex] = pixel.Hit
-                    self.toa_array[pixel.PixelIndex][pixel.ToaData] += 1
-                    #scale down tot data so we can use 128 bins for tot and toa
-                    HitDataTOTc = (pixel.TotData >>  2) & 0x7F
-                    tot_bin = int(HitDataTOTc/self.tot_binning_count)
-                    self.tot_array[pixel.PixelIndex][tot_bin] += 1
-            hits_toa_data_binary = np.reshape(hit_data, (self.ypixels,self.xpixels), order='F')
-            self.hits_toa_array += hits_toa_data_binary
-        if(snap): self.snapshot()
-        if(instant): self.instantaneous(toa_data_binary, tot_data_binary, hits_toa_data_binary)
-        self.has_new_data = True
+            self.acceptEvent(feb.ParseFrame(frame, self.decoder))
+
+
+    def acceptEvent(self, eventFrame):
+        self.histograms.fill(eventFrame)
 
 
     def refreshDisplay(self):
-        self.has_new_data = False
-        self.__makeDisplay(self.toa_array, self.tot_array, self.hits_toa_array)
+        # Render a snapshot of the accumulated histograms: the stream thread keeps filling meanwhile
+        snap = self.accumulator.snapshot()
+        self.__makeDisplay(snap['toa'], snap['tot'], snap['hits'])
 
 
     def makeDisplay(self, toa_data, tot_data, hits_toa_data, figname="onlineEventDisplay", snap=False):
         '''
-        This function updates the plot with the new arrays. The comments can be uncommented if
-        one wishes to establish a fixed number of tick marks on the various colorbars in the plot
+        This function updates the plot with the new arrays through the BlitRenderer: only the
+        three images are redrawn, the colorbars only when the color limits (rounded to 1-2-5 steps) change
         A copy of this function is made private to protect against changes from inheritance
-
-        the plt.pause() can be uncommented if one wishes to keep the plot constantly in the foreground
         '''
-        self.im.set_data(toa_data)
-        self.im1.set_data(tot_data)
-        self.im2.set_data(hits_toa_data)
-        self.cbar.mappable.set_clim(vmin=np.amin(toa_data),vmax=np.amax(toa_data))
-        self.cbar1.mappable.set_clim(vmin=np.amin(tot_data),vmax=np.amax(tot_data))
-        self.cbar2.mappable.set_clim(vmin=np.amin(hits_toa_data),vmax=np.amax(hits_toa_data))
-        self.cbar.draw_all()
-        self.cbar1.draw_all()
-        self.cbar2.draw_all()
-        #self.fig.tight_layout()
-        if(snap): self.fig.savefig(self.submitDir+"/"+ figname + ".pdf")
-        self.fig.canvas.draw()
-        #self.ax.draw_artist(self.im)
-        #self.ax1.draw_artist(self.im1)
-        #self.ax2.draw_artist(self.im2)
-        #self.fig.canvas.update()
-
-        self.fig.canvas.flush_events()
+        self.renderer.render([toa_data, tot_data, hits_toa_data])
+        if(snap): self.fig.figure.savefig(self.submitDir+"/"+ figname + ".pdf")
 
     __makeDisplay = makeDisplay
+
+
+class LiveDisplayManager(object):
+    '''
+    The live displays of several FPGAs in a single window, refreshed on the GUI thread:
+    one onlineEventDisplay per title, each drawn into its own subfigure. A QTimer calls
+    step() every interval/len(titles) seconds, which redraws (by blitting its subfigure)
+    the next display round-robin that has new data, so each board is refreshed about
+    every interval seconds and idle boards cost nothing (in the Window and Decay views
+    an idle board is still redrawn while its old entries expire or fade). When rendering
+    takes more than load of the GUI thread time, the following ticks are skipped (counted
+    in skippedTicks) so that the GUI stays responsive.
+
+        manager = feb.LiveDisplayManager(['FPGA 0', 'FPGA 1'], submitDir='display_snapshots', overwrite=True)
+        for i, display in enumerate(manager.displays):
+            top.eventDecoder[i].subscribe(display)
+        manager.start()   # from the GUI thread, before appTop.exec_()
+
+    fig_size is the size of one display, the other keyword arguments go to onlineEventDisplay.
+    '''
+    def __init__(self, titles, interval=1.0, load=0.5, ncols=None, font_size=4, fig_size=(10,6), backend='QT5Agg', **kwargs):
+        if backend is not None:
+            matplotlib.use(backend)
+        self.interval     = interval
+        self.tick         = interval/len(titles)
+        self.load         = load
+        self.redraws      = 0
+        self.skippedTicks = 0
+        self.renderTime   = None  # smoothed duration of a redraw (seconds)
+        self._next        = 0
+        self._skip        = 0
+        self._busy        = False
+        self._timer       = None
+
+        ncols = ncols if ncols is not None else int(np.ceil(np.sqrt(len(titles))))
+        nrows = int(np.ceil(len(titles)/ncols))
+        plt.rcParams.update({'font.size': font_size})
+        self.fig = plt.figure(num='Live Display', figsize=(fig_size[0]*ncols, fig_size[1]*nrows), dpi=100)
+        subfigs  = np.atleast_1d(self.fig.subfigures(nrows, ncols)).ravel()
+        self.displays = [onlineEventDisplay(plot_title=title, font_size=font_size, backend=None, fig=subfig, **kwargs)
+                         for title, subfig in zip(titles, subfigs)]
+        self.fig.canvas.draw()
+
+    def step(self):
+        # One timer tick: redraw the next display with new data, unless rendering is behind
+        if self._busy:
+            return
+        if self._skip > 0:
+            self._skip -= 1
+            self.skippedTicks += 1
+            return
+        for i in range(len(self.displays)):
+            index = (self._next + i) % len(self.displays)
+            if self.displays[index].has_new_data:
+                break
+        else:
+            return
+        self._next = (index + 1) % len(self.displays)
+
+        self._busy = True
+        try:
+            start = time.perf_counter()
+            self.displays[index].refreshDisplay()
+            elapsed = time.perf_counter() - start
+        finally:
+            self._busy = False
+        self.redraws += 1
+        self.renderTime = elapsed if self.renderTime is None else 0.8*self.renderTime + 0.2*elapsed
+        self._skip = int(self.renderTime/(self.load*self.tick))
+
+    def start(self):
+        # Requires the Qt application (matplotlib QT5Agg backend), call from the GUI thread
+        from PyQt5.QtCore import QTimer
+        self.fig.show()
+        self._timer = QTimer()
+        self._timer.timeout.connect(self.step)
+        self._timer.start(max(1, int(1000*self.tick)))
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import json
+import zlib
+import time
+import threading
+import traceback
+import numpy as np
+
+#################################################################
+
+def PackSnapshot(name, snapshot, level=1):
+    '''
+    ZeroMQ message of a LiveSnapshot: [name, JSON header, zlib compressed arrays].
+    Live histograms are mostly empty bins, they compress well even at level 1.
+    '''
+    arrays = [(key, np.ascontiguousarray(hist)) for key, hist in snapshot.histograms.items()]
+    header = {
+        'generation': snapshot.generation,
+        'entries'   : snapshot.entries,
+        'timestamp' : snapshot.timestamp,
+        'view'      : snapshot.view,
+        'arrays'    : [{'name': key, 'dtype': hist.dtype.str, 'shape': list(hist.shape)} for key, hist in arrays],
+    }
+    payload = zlib.compress(b''.join(hist.tobytes() for key, hist in arrays), level)
+    return [name.encode(), json.dumps(header).encode(), payload]
+
+def UnpackSnapshot(message):
+    # (name, header, {name: array}) of a PackSnapshot() message
+    name, header, payload = message
+    header = json.loads(header.decode())
+    data   = zlib.decompress(payload)
+    histograms = {}
+    offset = 0
+    for desc in header['arrays']:
+        dtype = np.dtype(desc['dtype'])
+        size  = dtype.itemsize*int(np.prod(desc['shape']))
+        histograms[desc['name']] = np.frombuffer(data, dtype=dtype, count=size//dtype.itemsize, offset=offset).reshape(desc['shape'])
+        offset += size
+    return name.decode(), header, histograms
+
+#################################################################
+
+class LivePublisher(object):
+    '''
+    Headless live monitoring: publishes the snapshots of LiveHistograms on a ZeroMQ
+    PUB socket every interval seconds (only the sources with new data, and all of
+    them every fullInterval seconds so that late viewers get a picture). The DAQ
+    process does no plotting; any number of viewers (scripts/LiveViewer.py) can
+    subscribe, from this or another host:
+        hist = feb.LiveHistograms()
+        top.eventDecoder[0].subscribe(hist)
+        publisher = feb.LivePublisher({'FPGA 0': hist}, port=9200)
+    '''
+    def __init__(self, sources, port=9200, host='*', interval=0.5, fullInterval=5.0):
+        self.sources      = dict(sources)
+        self.interval     = interval
+        self.fullInterval = fullInterval
+        self.sent         = 0
+        self.sentBytes    = 0
+        # pyzmq is only needed for live monitoring, not by every user of common
+        import zmq
+        self._zmq         = zmq
+        self._context     = zmq.Context.instance()
+        self._socket      = self._context.socket(zmq.PUB)
+        self._socket.setsockopt(zmq.SNDHWM, 10)  # slow viewers miss snapshots, they never block us
+        self._socket.bind(f'tcp://{host}:{port}')
+
+        self._running = True
+        self._thread  = threading.Thread(target=self._publishLoop, daemon=True)
+        self._thread.start()
+
+    def _publishLoop(self):
+        lastFull = 0.0
+        while self._running:
+            time.sleep(self.interval)
+            now  = time.time()
+            full = (now - lastFull) >= self.fullInterval
+            if full:
+                lastFull = now
+            for name, source in self.sources.items():
+                try:
+                    if full or source.hasNewData:
+                        message = PackSnapshot(name, source.snapshot())
+                        self._socket.send_multipart(message, self._zmq.NOBLOCK)
+                        self.sent      += 1
+                        self.sentBytes += sum(len(part) for part in message)
+                except self._zmq.Again:
+                    pass
+                except Exception:
+                    traceback.print_exc()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+        self._socket.close(linger=0)
+
+class LiveSubscriber(object):
+    '''
+    Viewer side of LivePublisher:
+        sub = feb.LiveSubscriber('tcp://daq-node:9200')
+        name, header, histograms = sub.receive(timeout=1.0)
+    '''
+    def __init__(self, address='tcp://localhost:9200'):
+        import zmq
+        self._context = zmq.Context.instance()
+        self._socket  = self._context.socket(zmq.SUB)
+        self._socket.setsockopt(zmq.SUBSCRIBE, b'')
+        self._socket.setsockopt(zmq.RCVHWM, 10)
+        self._socket.connect(address)
+
+    def receive(self, timeout=None):
+        # Next snapshot, or None after timeout seconds
+        if self._socket.poll(None if timeout is None else int(1000*timeout)) == 0:
+            return None
+        return UnpackSnapshot(self._socket.recv_multipart())
+
+    def close(self):
+        self._socket.close(linger=0)
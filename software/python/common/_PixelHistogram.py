@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import threading
+import numpy as np
+
+import rogue
+
+from common._DataStreamReader import FrameDecoder, ParseFrame
+from common._ScanProcessor    import ScanQuantities
+from common._HitFilter        import AllSelect
+from common._SlaveMonitor     import SlaveMonitor
+
+#################################################################
+
+DefaultHistograms = ['toa', 'tot', 'totf_vpa', 'totc_vpa', 'totf_tz', 'totc_tz']
+
+class PixelHistograms(object):
+    '''
+    Per-pixel integer histograms (numPixels x nbins) of TOA, TOT and the decoded
+    VPA/TZ fine/coarse TOT (see ScanQuantities), filled from a PixArray of one frame
+    or of a whole EventBatch. Optional keyed sub-histograms (e.g. per scan point)
+    are filled alongside the integrated ones. snapshot() and reset() cost O(bins).
+    Only the data words selected by hitFilter (HitFilter) are filled.
+    '''
+    def __init__(self, quantities=DefaultHistograms, numPixels=25, hitFilter=AllSelect):
+        self.quantities = list(quantities)
+        self.numPixels  = numPixels
+        self.hitFilter  = hitFilter
+        self.nbins      = {q: ScanQuantities[q][1] for q in self.quantities}
+        self._lock      = threading.Lock()
+        self.hist       = self._zeros()
+        self.keyed      = {}
+
+    def _zeros(self):
+        return {q: np.zeros((self.numPixels, self.nbins[q]), dtype=np.int64) for q in self.quantities}
+
+    def fill(self, pix, key=None):
+        # Compute the flat bin of every selected hit once per quantity
+        if self.hitFilter is not AllSelect:
+            pix = pix.select(self.hitFilter.mask(pix))
+        bins = {}
+        for q in self.quantities:
+            PixelIndex, value = ScanQuantities[q][0](pix)
+            keep = PixelIndex < self.numPixels
+            bins[q] = PixelIndex[keep].astype(np.int64)*self.nbins[q] + value[keep]
+
+        with self._lock:
+            targets = [self.hist]
+            if key is not None:
+                if key not in self.keyed:
+                    self.keyed[key] = self._zeros()
+                targets.append(self.keyed[key])
+
+            for q, flat in bins.items():
+                size = self.numPixels*self.nbins[q]
+                # Few hits: scatter-add, many hits: one bincount over the bins
+                counts = np.bincount(flat, minlength=size) if (flat.size > size >> 4) else None
+                for hist in targets:
+                    if counts is None:
+                        np.add.at(hist[q].reshape(-1), flat, 1)
+                    else:
+                        hist[q].reshape(-1)[:] += counts
+
+    def snapshot(self, key=None):
+        # Copies of the integrated (or keyed) histograms, {quantity: array}
+        with self._lock:
+            source = self.hist if key is None else self.keyed.get(key)
+            if source is None:
+                return self._zeros()
+            return {q: hist.copy() for q, hist in source.items()}
+
+    def keys(self):
+        with self._lock:
+            return list(self.keyed)
+
+    def reset(self, key=None):
+        # Reset everything, or only the sub-histograms of one key
+        with self._lock:
+            if key is None:
+                self.hist  = self._zeros()
+                self.keyed = {}
+            else:
+                self.keyed.pop(key, None)
+
+#################################################################
+
+class HistogramReader(SlaveMonitor, rogue.interfaces.stream.Slave):
+    '''
+    Stream Slave that fills PixelHistograms, e.g.
+        histReader = feb.HistogramReader()
+        pr.streamTap(top.dataStream[0], histReader)
+    The hits are also filled in the sub-histograms of scanPoint when it is not None.
+    '''
+    def __init__(self, quantities=DefaultHistograms, numPixels=25, hitFilter=AllSelect):
+        rogue.interfaces.stream.Slave.__init__(self)
+        self.decoder    = FrameDecoder()
+        self.histograms = PixelHistograms(quantities, numPixels, hitFilter)
+        self.scanPoint  = None
+
+    def _acceptFrame(self, frame):
+        with frame.lock():
+            self.acceptEvent(ParseFrame(frame, self.decoder))
+
+    def acceptEvent(self, eventFrame):
+        self.histograms.fill(eventFrame.pixArray, key=self.scanPoint)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import numpy as np
+import concurrent.futures
+
+from common._DataFileReader import DataFile
+from common._DataFileIndex  import DataFileIndex
+from common._TotDecoding    import DecodeTot
+from common._HitFilter      import HitSelect, ToaSelect
+
+#################################################################
+
+NumPixelIndex = 32 # PixelIndex is a 5-bit field
+
+def _toa(pix):
+    mask = ToaSelect.mask(pix)
+    return pix.PixelIndex[mask], pix.ToaData[mask]
+
+def _tot(pix):
+    mask = HitSelect.mask(pix)
+    return pix.PixelIndex[mask], pix.TotData[mask]
+
+def _decodedTot(mode, field):
+    def quantity(pix):
+        tot = DecodeTot(pix, mode)
+        return tot.PixelIndex, getattr(tot, field)
+    return quantity
+
+# Quantities a scan step can be reduced to: name -> (function(PixArray) -> (PixelIndex, value), number of bins)
+ScanQuantities = {
+    'toa':           (_toa, 128),
+    'tot':           (_tot, 512),
+    'totf_vpa':      (_decodedTot('vpa', 'TOTf'),       8),
+    'totc_vpa':      (_decodedTot('vpa', 'TOTc'),      128),
+    'totc_int1_vpa': (_decodedTot('vpa', 'TOTc_int1'),  64),
+    'totf_tz':       (_decodedTot('tz',  'TOTf'),       16),
+    'totc_tz':       (_decodedTot('tz',  'TOTc'),       64),
+    'totc_int1_tz':  (_decodedTot('tz',  'TOTc_int1'),  32),
+}
+
+def ReduceFile(path, channel=0, quantity='toa', start=0, stop=None, chunkFrames=100000, hitFilter=None):
+    # Per-pixel histogram, shape (32, nbins), of one quantity over [start,stop) of a data file,
+    # optionally restricted to the data words selected by hitFilter (HitFilter)
+    function, nbins = ScanQuantities[quantity]
+    hist = np.zeros(NumPixelIndex*nbins, dtype=np.int64)
+    with DataFile(path) as dataFile:
+        pos = start
+        while True:
+            hdr = dataFile.headers(pos, stop, maxRecords=chunkFrames)
+            if len(hdr) == 0:
+                break
+            pos = hdr.nextOffset
+            batches = dataFile.decodeRecords(hdr.Offset, hdr.PayloadSize, hdr.Channel, [channel])
+            if channel in batches:
+                pix = batches[channel].pixArray
+                if hitFilter is not None:
+                    pix = pix.select(hitFilter.mask(pix))
+                PixelIndex, value = function(pix)
+                hist += np.bincount(PixelIndex.astype(np.int64)*nbins + value, minlength=hist.size)
+    return hist.reshape(NumPixelIndex, nbins)
+
+def _reduceTask(task):
+    key, path, channel, quantity, start, stop, hitFilter = task
+    return key, ReduceFile(path, channel, quantity, start, stop, hitFilter=hitFilter)
+
+#################################################################
+
+class ScanStepResult(object):
+    # Reduced result of one scan step: the per-pixel histogram and the statistics derived from it
+    def __init__(self, key, quantity, hist):
+        self.key      = key
+        self.quantity = quantity
+        self.hist     = hist
+
+    def histogram(self, pixel=None):
+        return self.hist.sum(axis=0) if pixel is None else self.hist[pixel]
+
+    def count(self, pixel=None):
+        return int(self.histogram(pixel).sum())
+
+    def mean(self, pixel=None):
+        hist = self.histogram(pixel)
+        n = hist.sum()
+        return float(np.dot(np.arange(hist.size), hist)/n) if n > 0 else 0.0
+
+    def std(self, pixel=None, quantization=None):
+        # Population standard deviation (same as np.std of the hit values),
+        # with quantization=LSB the term LSB**2/12 is added to the variance
+        hist = self.histogram(pixel)
+        n = hist.sum()
+        if n == 0:
+            return 0.0
+        value = np.arange(hist.size)
+        mean  = np.dot(value, hist)/n
+        var   = np.dot((value-mean)**2, hist)/n
+        if quantization is not None:
+            var += quantization**2/12
+        return float(np.sqrt(var))
+
+    def values(self, pixel=None):
+        # The hit values themselves (in increasing order), e.g. for plotting
+        hist = self.histogram(pixel)
+        return np.repeat(np.arange(hist.size), hist)
+
+class ScanDataset(object):
+    '''
+    Reduces a multi-file scan (one data file per scan step, e.g. the TestData/TOA%d.dat
+    written by test_Bojan.py) on a process pool. Each worker decodes a file, or a chunk of
+    a file defined by its DataFileIndex, and only returns a per-pixel histogram.
+
+        dataset = feb.ScanDataset({delay: f'TestData/TOA{delay}.dat' for delay in delays}, quantity='toa')
+        for result in dataset.process():
+            print(result.key, result.count(), result.mean(), result.std())
+    '''
+    def __init__(self, files, channel=0, quantity='toa', processes=None, framesPerChunk=None, hitFilter=None):
+        if quantity not in ScanQuantities:
+            raise ValueError(f'quantity must be one of {list(ScanQuantities)}, got {quantity}')
+        self.files          = dict(files)
+        self.channel        = channel
+        self.quantity       = quantity
+        self.processes      = processes
+        self.framesPerChunk = framesPerChunk
+        self.hitFilter      = hitFilter
+
+    def _tasks(self):
+        for key, path in self.files.items():
+            if self.framesPerChunk is None:
+                yield (key, path, self.channel, self.quantity, 0, None, self.hitFilter)
+            else:
+                # Split large files into record-aligned chunks using the sidecar index
+                for start, stop in DataFileIndex(path).chunks(self.framesPerChunk):
+                    yield (key, path, self.channel, self.quantity, start, stop, self.hitFilter)
+
+    def process(self):
+        # Returns a list of ScanStepResult in the order of the files
+        nbins = ScanQuantities[self.quantity][1]
+        hists = {key: np.zeros((NumPixelIndex, nbins), dtype=np.int64) for key in self.files}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.processes) as executor:
+            for key, hist in executor.map(_reduceTask, self._tasks()):
+                hists[key] += hist
+        return [ScanStepResult(key, self.quantity, hists[key]) for key in self.files]
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import bisect
+import threading
+import time
+
+import rogue
+
+from common._DataStreamReader import FrameDecoder, ParseFrame
+from common._HitStore         import HitStore
+from common._HitFilter        import HitSelect
+from common._SlaveMonitor     import SlaveMonitor
+
+#################################################################
+
+class ScanStep(object):
+    # Hits of one scan step: the frames whose key is in [first, last)
+    def __init__(self, point, first, maxHits):
+        self.point       = point
+        self.first       = first
+        self.last        = None  # set by endStep()
+        self.maxHits     = maxHits
+        self.frames      = 0
+        self.droppedHits = 0
+        self.hits        = HitStore()
+
+    @property
+    def expected(self):
+        return None if self.last is None else self.last - self.first
+
+    # TOA of the hits without ToaOverflow (as HitDataReader.HitData)
+    @property
+    def HitData(self):
+        return self.hits.column('ToaData')[self.hits.column('ToaOverflow') == 0]
+
+class ScanStepReader(SlaveMonitor, rogue.interfaces.stream.Slave):
+    '''
+    Hit reader for scans that attributes every frame to the scan step whose pulses
+    produced it, from the range of the frame counter key ('TrigCnt' or 'SeqCnt')
+    recorded while the step was issued, instead of the scan point current when the
+    frame arrives. Steps can overlap, no sleep is needed between them:
+
+        reader.beginStep(delay, top.Fpga[0].Asic.Trig.TriggerCnt.get())
+        ... CalPulse.Start() ...
+        reader.endStep(top.Fpga[0].Asic.Trig.TriggerCnt.get())
+        step = reader.popStep(previousDelay, timeout=1.0)
+
+    The frame counter of the n-th trigger after a reset is n-1+offset. A step is
+    complete once it got last-first frames or a frame of a later trigger arrived.
+    Memory is bounded: each step keeps at most maxHits hits (the rest is counted in
+    droppedHits) and at most maxSteps steps are held (the oldest ones are dropped and
+    counted in droppedSteps). Frames outside every step are counted in unassigned.
+    If a StreamingStats is given, the TOA of the hits is accumulated with scan=point.
+    '''
+    def __init__(self, key='TrigCnt', offset=0, maxHits=1000000, maxSteps=64, stats=None, hitFilter=HitSelect):
+        rogue.interfaces.stream.Slave.__init__(self)
+        if key not in ['TrigCnt', 'SeqCnt']:
+            raise ValueError(f'key must be either [TrigCnt,SeqCnt], got {key}')
+        self.key          = key
+        self.offset       = offset
+        self.maxHits      = maxHits
+        self.maxSteps     = maxSteps
+        self.stats        = stats
+        self.hitFilter    = hitFilter
+        self.decoder      = FrameDecoder()
+        self.unassigned   = 0
+        self.droppedSteps = 0
+        self._cond        = threading.Condition()
+        self._steps       = []  # open and complete steps, by first
+        self._firsts      = []
+        self._maxKey      = None
+
+    def beginStep(self, point, first):
+        # Frames from counter value first on belong to point (until endStep)
+        with self._cond:
+            if self._steps and (self._steps[-1].last is None):
+                self._steps[-1].last = first
+            while len(self._steps) >= self.maxSteps:
+                self._steps.pop(0)
+                self._firsts.pop(0)
+                self.droppedSteps += 1
+            step = ScanStep(point, first, self.maxHits)
+            index = bisect.bisect_right(self._firsts, first)
+            self._steps.insert(index, step)
+            self._firsts.insert(index, first)
+            return step
+
+    def endStep(self, last):
+        # The current step ends before counter value last
+        with self._cond:
+            if self._steps and (self._steps[-1].last is None):
+                self._steps[-1].last = last
+            self._cond.notify_all()
+
+    def _find(self, point):
+        for step in self._steps:
+            if step.point == point:
+                return step
+        return None
+
+    def _complete(self, step):
+        return (step.last is not None) and ((step.frames >= step.expected) or
+                ((self._maxKey is not None) and (self._maxKey >= step.last)))
+
+    def waitStep(self, point, timeout=1.0):
+        # Wait until the frames of the step arrived, returns False on timeout
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                step = self._find(point)
+                if (step is None) or self._complete(step):
+                    return step is not None
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+
+    def popStep(self, point, timeout=1.0):
+        # Wait for the step and hand it over (ScanStep), None if unknown
+        self.waitStep(point, timeout)
+        with self._cond:
+            step = self._find(point)
+            if step is not None:
+                index = self._steps.index(step)
+                self._steps.pop(index)
+                self._firsts.pop(index)
+            return step
+
+    def clear(self):
+        with self._cond:
+            self._steps  = []
+            self._firsts = []
+            self._maxKey = None
+
+    def _acceptFrame(self, frame):
+        with frame.lock():
+            self.acceptEvent(ParseFrame(frame, self.decoder))
+
+    def acceptEvent(self, eventFrame):
+        key = int(getattr(eventFrame, self.key)) - self.offset
+        pix = eventFrame.pixArray
+        hit = self.hitFilter.mask(pix)
+        with self._cond:
+            self._maxKey = key if self._maxKey is None else max(self._maxKey, key)
+
+            index = bisect.bisect_right(self._firsts, key) - 1
+            step  = self._steps[index] if index >= 0 else None
+            if (step is None) or ((step.last is not None) and (key >= step.last)):
+                self.unassigned += 1
+                self._cond.notify_all()
+                return
+            step.frames += 1
+
+            # The step buffer is bounded, the statistics still get every hit
+            keep = hit
+            n    = int(hit.sum())
+            room = max(step.maxHits - len(step.hits), 0)
+            if n > room:
+                step.droppedHits += n - room
+                keep = hit.copy()
+                keep[hit.nonzero()[0][room:]] = False
+            step.hits.append(
+                PixelIndex  = pix.PixelIndex[keep],
+                TotOverflow = pix.TotOverflow[keep],
+                TotData     = pix.TotData[keep],
+                ToaOverflow = pix.ToaOverflow[keep],
+                ToaData     = pix.ToaData[keep],
+            )
+            if self.stats is not None:
+                toa = hit & (pix.ToaOverflow == 0)
+                self.stats.update(eventFrame.Channel, pix.PixelIndex[toa], pix.ToaData[toa], scan=step.point)
+            self._cond.notify_all()
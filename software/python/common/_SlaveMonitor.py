@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import time
+import json
+import weakref
+import functools
+import threading
+
+import pyrogue as pr
+
+#################################################################
+
+class LatencyHistogram(object):
+    '''
+    Log-linear (HDR style) histogram of durations in ns: values below 16 ns have their
+    own bucket, above that every power of two is split in 16 buckets (~6% resolution).
+    Recording is a few integer operations, whatever the value.
+    '''
+    SubBuckets = 16
+    NumBuckets = 16*40  # up to 2**40 ns (~18 min), larger values go to the last bucket
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0]*self.NumBuckets
+        self.count  = 0
+        self.sum    = 0
+        self.max    = 0
+
+    def record(self, ns):
+        if ns < 16:
+            index = max(ns, 0)
+        else:
+            shift = ns.bit_length() - 5
+            index = min(((shift+1) << 4) + (ns >> shift) - 16, self.NumBuckets-1)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum   += ns
+        if ns > self.max:
+            self.max = ns
+
+    @classmethod
+    def lowerBound(cls, index):
+        if index < 16:
+            return index
+        shift = (index >> 4) - 1
+        return (16 + (index & 0xF)) << shift
+
+    def percentile(self, q):
+        # Lower bound of the bucket holding the q-th percentile (ns)
+        if self.count == 0:
+            return 0
+        target = q/100.0*self.count
+        total  = 0
+        for index, n in enumerate(self.counts):
+            total += n
+            if n and (total >= target):
+                return self.lowerBound(index)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum/self.count if self.count else 0.0
+
+    def toDict(self):
+        return {
+            'count'  : self.count,
+            'meanNs' : self.mean,
+            'maxNs'  : self.max,
+            'p50Ns'  : self.percentile(50),
+            'p99Ns'  : self.percentile(99),
+            'p999Ns' : self.percentile(99.9),
+            'buckets': {self.lowerBound(i): n for i, n in enumerate(self.counts) if n},
+        }
+
+#################################################################
+
+class SlaveStats(object):
+    # Counters and latency histograms of one monitored Slave
+    def __init__(self, name, splitDecode):
+        self.name        = name
+        self.splitDecode = splitDecode
+        self._lock       = threading.Lock()
+        self._local      = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.frames  = 0
+            self.bytes   = 0
+            self.events  = 0
+            self.accept  = LatencyHistogram()  # whole _acceptFrame
+            self.decode  = LatencyHistogram()  # _acceptFrame minus the consume part
+            self.consume = LatencyHistogram()  # acceptEvent (or the class' consume method)
+            self._start  = time.time()
+
+    def addFrame(self, size, elapsed, consumed):
+        with self._lock:
+            self.frames += 1
+            self.bytes  += size
+            self.accept.record(elapsed)
+            if self.splitDecode:
+                self.decode.record(elapsed - consumed)
+
+    def addEvent(self, elapsed):
+        with self._lock:
+            self.events += 1
+            self.consume.record(elapsed)
+
+    def toDict(self):
+        with self._lock:
+            elapsed = max(time.time() - self._start, 1e-9)
+            return {
+                'name'     : self.name,
+                'frames'   : self.frames,
+                'bytes'    : self.bytes,
+                'events'   : self.events,
+                'frameRate': self.frames/elapsed,
+                'byteRate' : self.bytes/elapsed,
+                'seconds'  : elapsed,
+                'accept'   : self.accept.toDict(),
+                'decode'   : self.decode.toDict(),
+                'consume'  : self.consume.toDict(),
+            }
+
+#################################################################
+
+# The instances instrumented so far (weak references)
+_monitored      = []
+_monitoredLock  = threading.Lock()
+_monitoredCount = {}
+
+def _getStats(slave):
+    stats = slave.__dict__.get('_slaveStats')
+    if stats is None:
+        with _monitoredLock:
+            stats = slave.__dict__.get('_slaveStats')
+            if stats is None:
+                cls   = type(slave)
+                index = _monitoredCount.get(cls.__name__, 0)
+                _monitoredCount[cls.__name__] = index + 1
+                name  = slave.__dict__.get('monitorName') or f'{cls.__name__}[{index}]'
+                stats = SlaveStats(name, (cls._monitorConsume is not None) and hasattr(cls, cls._monitorConsume))
+                slave.__dict__['_slaveStats'] = stats
+                _monitored[:] = [ref for ref in _monitored if ref() is not None] + [weakref.ref(slave)]
+    return stats
+
+def _monitorFrame(method):
+    @functools.wraps(method)
+    def _acceptFrame(self, frame):
+        if not SlaveMonitor.enable:
+            return method(self, frame)
+        stats = _getStats(self)
+        local = stats._local
+        if getattr(local, 'inFrame', False):
+            # A subclass calling the base class _acceptFrame: timed by the outer call
+            return method(self, frame)
+        local.inFrame  = True
+        local.consumed = 0
+        size  = frame.getPayload()
+        start = time.perf_counter_ns()
+        try:
+            return method(self, frame)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            local.inFrame = False
+            stats.addFrame(size, elapsed, local.consumed)
+    return _acceptFrame
+
+def _monitorConsume(method):
+    @functools.wraps(method)
+    def consume(self, *args, **kwargs):
+        if not SlaveMonitor.enable:
+            return method(self, *args, **kwargs)
+        stats = _getStats(self)
+        local = stats._local
+        if getattr(local, 'inConsume', False):
+            return method(self, *args, **kwargs)
+        local.inConsume = True
+        start = time.perf_counter_ns()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            local.inConsume = False
+            if getattr(local, 'inFrame', False):
+                local.consumed += elapsed
+            stats.addEvent(elapsed)
+    return consume
+
+class SlaveMonitor(object):
+    '''
+    Mixin instrumenting a rogue stream Slave, listed before the Slave base class:
+        class HitDataReader(SlaveMonitor, rogue.interfaces.stream.Slave)
+    The _acceptFrame (and _monitorConsume) methods defined by every subclass are
+    wrapped when the class is created, and count the frames, bytes and events and
+    fill latency histograms of the whole _acceptFrame, of the decode part and of the
+    consume part (acceptEvent by default, also timed when an EventDecoder calls it).
+    Set monitorName before the first frame to replace the default ClassName[n].
+    '''
+    _monitorConsume = 'acceptEvent'
+    enable          = True  # switch for all the instances
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if '_acceptFrame' in cls.__dict__:
+            setattr(cls, '_acceptFrame', _monitorFrame(cls.__dict__['_acceptFrame']))
+        consume = cls._monitorConsume
+        if (consume is not None) and (consume in cls.__dict__):
+            setattr(cls, consume, _monitorConsume(cls.__dict__[consume]))
+
+    @property
+    def slaveStats(self):
+        return _getStats(self)
+
+def MonitoredSlaves():
+    # The instrumented slaves still alive, in creation order
+    with _monitoredLock:
+        return [slave for slave in (ref() for ref in _monitored) if slave is not None]
+
+def MonitorReport():
+    return [slave.slaveStats.toDict() for slave in MonitoredSlaves()]
+
+def DumpMonitorReport(path):
+    with open(path, 'w') as f:
+        json.dump(MonitorReport(), f, indent=2)
+
+#################################################################
+
+class SlaveMonitoring(pr.Device):
+    '''
+    Frame, byte and latency statistics of all the instrumented stream Slaves
+    (SlaveMonitor), including the ones created after Top. Dumped to JSON next to the
+    open data file by Top.StopRun, or on demand with the Dump command.
+    '''
+    def __init__(self,
+            name        = 'SlaveMonitoring',
+            description = 'Stream Slave hot-path statistics',
+            **kwargs):
+
+        super().__init__(
+            name        = name,
+            description = description,
+            **kwargs)
+
+        self._dumpFile = ''
+
+        self.add(pr.LocalVariable(
+            name         = 'Enable',
+            description  = 'Time and count the frames of the stream Slaves',
+            mode         = 'RW',
+            value        = True,
+            localSet     = lambda value: setattr(SlaveMonitor, 'enable', bool(value)),
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Slaves',
+            mode         = 'RO',
+            value        = 0,
+            localGet     = lambda: len(MonitoredSlaves()),
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'Summary',
+            description  = 'Frames, MB/s and _acceptFrame latency (us) of every Slave',
+            mode         = 'RO',
+            value        = '',
+            localGet     = self.summary,
+            pollInterval = 1,
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = 'DumpFile',
+            description  = 'Last JSON report written',
+            mode         = 'RO',
+            value        = '',
+            localGet     = lambda: self._dumpFile,
+        ))
+
+        @self.command(description='Write the statistics to a JSON file', value='')
+        def Dump(arg):
+            path = arg if arg else time.strftime('SlaveMonitor-%Y%m%d_%H%M%S.json')
+            self.dump(path)
+
+        @self.command(description='Reset the statistics of all the Slaves')
+        def CountReset():
+            for slave in MonitoredSlaves():
+                slave.slaveStats.reset()
+
+    def dump(self, path):
+        DumpMonitorReport(path)
+        self._dumpFile = path
+        print(f'Slave statistics written to {path}')
+
+    def summary(self):
+        lines = ['{:<24} {:>10} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+            'Slave', 'Frames', 'MB/s', 'p50', 'p99', 'max', 'cons.p99')]
+        for slave in MonitoredSlaves():
+            stats = slave.slaveStats
+            with stats._lock:
+                elapsed = max(time.time() - stats._start, 1e-9)
+                lines.append('{:<24} {:>10} {:>8.2f} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f}'.format(
+                    stats.name, stats.frames, stats.bytes/elapsed/1e6,
+                    stats.accept.percentile(50)/1e3, stats.accept.percentile(99)/1e3,
+                    stats.accept.max/1e3, stats.consume.percentile(99)/1e3))
+        return '\n'.join(lines)
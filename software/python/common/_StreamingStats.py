@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import math
+import threading
+import numpy as np
+
+#################################################################
+
+class StatsResult(object):
+    def __init__(self, count, mean, std, min, max):
+        self.count = count
+        self.mean  = mean
+        self.std   = std
+        self.min   = min
+        self.max   = max
+
+def _merge(a, b):
+    # Chan et al. pairwise combination of (count, mean, M2, min, max) arrays, shape (5, n)
+    na, nb = a[0], b[0]
+    n      = na + nb
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = b[1] - a[1]
+        mean  = np.where(n > 0, a[1] + delta*nb/n, 0.0)
+        M2    = np.where(n > 0, a[2] + b[2] + delta*delta*na*nb/n, 0.0)
+    return np.stack((n, mean, M2, np.minimum(a[3], b[3]), np.maximum(a[4], b[4])))
+
+def _empty(numPixels):
+    stats = np.zeros((5, numPixels))
+    stats[3] = np.inf
+    stats[4] = -np.inf
+    return stats
+
+class StreamingStats(object):
+    '''
+    Constant-memory running statistics (Welford count, mean, M2, min, max) of hit
+    values per (fpga, pixel, scan value). Each update() is reduced per pixel with
+    np.bincount and merged into the running values, so results are available at
+    any time during a scan, and partial results from other processes can be merge()d.
+
+        stats = feb.StreamingStats()
+        stats.update(fpga, PixelIndex, ToaData, scan=delay)
+        r = stats.result(fpga, scan=delay, quantization=1.0)  # std includes LSB/sqrt(12)
+
+    The readers pass eventFrame.Channel as fpga: the FPGA index for the frames of
+    Top.eventDecoder[i] and of the data files (not the live stream channel, 0 for all).
+    '''
+    def __init__(self, numPixels=32):
+        self.numPixels = numPixels
+        self._stats    = {}
+        self._lock     = threading.Lock()
+
+    def update(self, fpga, PixelIndex, value, scan=None):
+        PixelIndex = np.asarray(PixelIndex, dtype=np.int64)
+        value      = np.asarray(value, dtype=np.float64)
+        if value.size == 0:
+            return
+
+        # Statistics of this batch per pixel (two-pass for the M2)
+        count = np.bincount(PixelIndex, minlength=self.numPixels).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, np.bincount(PixelIndex, weights=value, minlength=self.numPixels)/count, 0.0)
+        M2 = np.bincount(PixelIndex, weights=(value-mean[PixelIndex])**2, minlength=self.numPixels)
+        batch = _empty(self.numPixels)
+        batch[0], batch[1], batch[2] = count, mean, M2
+        np.minimum.at(batch[3], PixelIndex, value)
+        np.maximum.at(batch[4], PixelIndex, value)
+
+        key = (fpga, scan)
+        with self._lock:
+            self._stats[key] = _merge(self._stats.get(key, _empty(self.numPixels)), batch)
+
+    def merge(self, other):
+        # Combine the partial results of another StreamingStats
+        with self._lock:
+            for key, stats in other._stats.items():
+                self._stats[key] = _merge(self._stats.get(key, _empty(self.numPixels)), stats)
+
+    def keys(self):
+        # List of (fpga, scan) keys
+        with self._lock:
+            return list(self._stats)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def result(self, fpga=0, pixel=None, scan=None, quantization=None):
+        '''
+        Statistics of one pixel, or of all pixels combined (pixel=None).
+        The std is the population std (as np.std); with quantization=LSB the
+        uniform quantization term LSB**2/12 is added to the variance.
+        '''
+        with self._lock:
+            stats = self._stats.get((fpga, scan), _empty(self.numPixels))
+        if pixel is None:
+            total = _empty(1)
+            for i in range(self.numPixels):
+                total = _merge(total, stats[:, i:i+1])
+            stats = total[:, 0]
+        else:
+            stats = stats[:, pixel]
+
+        count = int(stats[0])
+        if count == 0:
+            return StatsResult(0, 0.0, 0.0, 0.0, 0.0)
+        var = stats[2]/count
+        if quantization is not None:
+            var += quantization**2/12
+        return StatsResult(count, float(stats[1]), math.sqrt(var), float(stats[3]), float(stats[4]))
@@ -33,7 +33,7 @@ if rogue.Version.current() != 'v3.7.0':
     click.secho(errMsg, bg='red')
     raise ValueError(errMsg)
 
-class SemAsciiFileWriter(rogue.interfaces.stream.Slave):
+class SemAsciiFileWriter(common.SlaveMonitor, rogue.interfaces.stream.Slave):
     def __init__(self):
         rogue.interfaces.stream.Slave.__init__(self)
 
@@ -72,6 +72,10 @@ class Top(pr.Root):
             userYaml    = [''],
             defaultFile = 'config/AsicVersion2/defaults.yml',
             asicVersion = 2,
+            dataReaders = None,
+            buildEvents = False,
+            decoderQueueSize = 100,
+            decoderBlocking  = False,
             **kwargs):
         super().__init__(name=name, description=description, **kwargs)
 
@@ -94,6 +98,7 @@ class Top(pr.Root):
         self.defaultFile = defaultFile
         self.pllConfig   = [None for i in range(self.numEthDev)]
         self.asicVersion = asicVersion
+        self.dataReaders = [list(readers) for readers in dataReaders] if dataReaders is not None else [[] for i in range(self.numEthDev)]
 
         # Check if missing refClkSel configuration
         if (len(refClkSel) < len(ip)):
@@ -124,9 +129,15 @@ class Top(pr.Root):
         self.dataStream = [None for i in range(self.numEthDev)]
         self.semStream  = [None for i in range(self.numEthDev)]
         self.memMap     = [None for i in range(self.numEthDev)]
+        self.eventDecoder = [None for i in range(self.numEthDev)]
+        self.dataIntegrity = [None for i in range(self.numEthDev)]
 
         # SEM monitor streams
         self.semDataWriter = SemAsciiFileWriter()
+        self.semDataWriter.monitorName = 'SemAsciiFileWriter'
+
+        # Statistics of the stream Slaves
+        self.add(common.SlaveMonitoring(expand=False))
 
         # Loop through the devices
         for i in range(self.numEthDev):
@@ -153,9 +164,38 @@ class Top(pr.Root):
                 # Connect data stream to file as channel to dataStream
                 pr.streamConnect(self.dataStream[i],self.dataWriter.getChannel(i))
 
-                # Connect to the SEM monitor streams and file writer
-                pr.streamConnect(self.semStream[i], self.semDataWriter)
-                pr.streamTap(self.semStream[i],self.dataWriter.getChannel(i+128))
+                # Connect to the SEM monitor streams and file writer (no SEM stream in simulation)
+                if self.semStream[i] is not None:
+                    pr.streamConnect(self.semStream[i], self.semDataWriter)
+                    pr.streamTap(self.semStream[i],self.dataWriter.getChannel(i+128))
+
+                # Validate the data stream headers
+                integrity = common.DataIntegrity(
+                    name   = f'DataIntegrity[{i}]',
+                    expand = False,
+                )
+                self.add(integrity)
+                self.dataIntegrity[i] = integrity
+                pr.streamTap(self.dataStream[i], integrity.reader)
+
+                # Decode every frame once, off the receive thread, for the
+                # consumers subscribed to self.eventDecoder[i]. When its queue is full
+                # the frames are dropped (DropCount), or with decoderBlocking the
+                # stream waits for the decoder: no frame is lost (calibrations)
+                self.eventDecoder[i] = common.EventDecoder(channel=i)
+                self.eventDecoder[i].monitorName = f'EventDecoder[{i}]'
+                self.dataReaders[i].append(common.AsyncStream(
+                    target    = self.eventDecoder[i],
+                    name      = f'EventDecoder[{i}]',
+                    queueSize = decoderQueueSize,
+                    block     = decoderBlocking,
+                    expand    = False,
+                ))
+
+                # Asynchronous consumers (common.AsyncStream devices) of this data stream
+                for reader in self.dataReaders[i]:
+                    self.add(reader)
+                    pr.streamTap(self.dataStream[i], reader.slave)
 
             ######################################################################
 
@@ -172,6 +212,17 @@ class Top(pr.Root):
 
             ######################################################################
 
+        # Merge the decoded frames of all the FPGAs into global events
+        self.eventBuilder = None
+        if buildEvents and not self.configProm:
+            self.eventBuilder = common.EventBuilder(channels=range(self.numEthDev))
+            self.add(common.EventBuilding(
+                builder = self.eventBuilder,
+                expand  = False,
+            ))
+            for i in range(self.numEthDev):
+                self.eventBuilder.feedFrom(i, self.eventDecoder[i])
+
         self.add(pr.LocalVariable(
             name         = "LiveDisplayRst",
             mode         = "RW",
@@ -179,6 +230,36 @@ class Top(pr.Root):
             hidden       = True,
         ))
 
+        # Histograms shown by the live displays registered with add_live_display_views()
+        self.view_list = []
+
+        self.add(pr.LocalVariable(
+            name         = "LiveDisplayView",
+            description  = "Live display histograms: integrated since LiveDisplayReset, of the last LiveDisplayWindow seconds or exponentially decaying with LiveDisplayDecay",
+            mode         = "RW",
+            value        = 0,
+            enum         = {i: view for i, view in enumerate(common.LiveViews)},
+            localSet     = lambda value: self._setLiveDisplayView(view=common.LiveViews[value]),
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = "LiveDisplayWindow",
+            description  = "Length of the LiveDisplayView Window (restarts it)",
+            mode         = "RW",
+            value        = 60.0,
+            units        = 's',
+            localSet     = lambda value: self._setLiveDisplayView(window=value),
+        ))
+
+        self.add(pr.LocalVariable(
+            name         = "LiveDisplayDecay",
+            description  = "Time constant of the LiveDisplayView Decay",
+            mode         = "RW",
+            value        = 60.0,
+            units        = 's',
+            localSet     = lambda value: self._setLiveDisplayView(decay=value),
+        ))
+
         @self.command()
         def LiveDisplayReset(arg):
             print('LiveDisplayReset()')
@@ -202,6 +283,17 @@ class Top(pr.Root):
                     self.Fpga[i].Asic.Trig.EnableReadout.set(0x0)
                     click.secho(f'self.Fpga[{i}].Asic.Trig.EnableReadout.set(0x0)', bg='magenta')
 
+            # Check the last frames of the run
+            for integrity in self.dataIntegrity:
+                if integrity is not None:
+                    integrity.reader.flush()
+
+            # Keep the stream Slave statistics of the run next to the data file
+            # (without a data file they are only written by SlaveMonitoring.Dump)
+            dataFile = self.dataWriter.DataFile.value()
+            if dataFile and self.dataWriter.Open.value():
+                self.SlaveMonitoring.dump(os.path.splitext(dataFile)[0] + '_slaves.json')
+
         @self.command(description='This command is intended to be executed after self.dataWriter is opened')
         def StartRun(arg):
             click.secho('StartRun()', bg='blue')
@@ -251,6 +343,18 @@ class Top(pr.Root):
     def add_live_display_resets(self, reset_list):
         self.reset_list = reset_list
 
+    def add_live_display_views(self, view_list):
+        # setView(view, window, decay) functions of the live displays, set to the current LiveDisplayView
+        self.view_list = view_list
+        self._setLiveDisplayView(
+            view   = common.LiveViews[self.LiveDisplayView.value()],
+            window = self.LiveDisplayWindow.value(),
+            decay  = self.LiveDisplayDecay.value(),
+        )
+
+    def _setLiveDisplayView(self, **kwargs):
+        for setView in self.view_list: setView(**kwargs)
+
 
     def start(self,**kwargs):
         super(Top, self).start(**kwargs)
@@ -407,4 +511,10 @@ class Top(pr.Root):
 
     def stop(self):
         self.semDataWriter.close()
+        for readers in self.dataReaders:
+            for reader in readers:
+                reader.stop()
+        for integrity in self.dataIntegrity:
+            if integrity is not None:
+                integrity.stop()
         super().stop()
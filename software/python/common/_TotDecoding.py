@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import numpy as np
+
+#################################################################
+
+# Tables are indexed by TotIndex = (TotOverflow << 9) | TotData
+TotTableSize = 2*512
+
+def TotIndex(pix):
+    return (pix.TotOverflow.astype(np.uint16) << 9) | pix.TotData
+
+class TotTable(object):
+    '''
+    Precomputed TOT decoding for one TDC layout:
+        VPA: TOTf = TotData[1:0] + 4*TotOverflow, TOTc = TotData[8:2], invalid marker 0x1fc
+        TZ:  TOTf = TotData[2:0] + 8*TotOverflow, TOTc = TotData[8:3], invalid marker 0x1f8
+    TOTc_int1 is the coarse value when the coarse counter runs at half rate (IntF = 1)
+    '''
+    def __init__(self, name, fineBits, invalid):
+        index       = np.arange(TotTableSize)
+        TotOverflow = index >> 9
+        TotData     = index & 0x1FF
+        coarseMask  = 0x1FF >> fineBits
+
+        self.name      = name
+        self.TOTf      = ((TotData & ((1 << fineBits)-1)) + (TotOverflow << fineBits)).astype(np.uint8)
+        self.TOTc      = ((TotData >> fineBits) & coarseMask).astype(np.uint8)
+        self.TOTc_int1 = ((((TotData >> fineBits) + 1) >> 1) & (coarseMask >> 1)).astype(np.uint8)
+        self.Valid     = (TotData != invalid)
+
+TotTableVpa = TotTable('vpa', fineBits=2, invalid=0x1fc)
+TotTableTz  = TotTable('tz',  fineBits=3, invalid=0x1f8)
+
+def GetTotTable(mode):
+    if mode == 'vpa':
+        return TotTableVpa
+    elif mode == 'tz':
+        return TotTableTz
+    raise ValueError(f'TOT mode must be either [vpa,tz], got {mode}')
+
+#################################################################
+
+class TotValues(object):
+    # Decoded TOT of the selected hits (integer arrays, one entry per selected hit)
+    def __init__(self, mask, PixelIndex, TOTf, TOTc, TOTc_int1):
+        self.mask       = mask
+        self.PixelIndex = PixelIndex
+        self.TOTf       = TOTf
+        self.TOTc       = TOTc
+        self.TOTc_int1  = TOTc_int1
+
+    def __len__(self):
+        return len(self.TOTf)
+
+def DecodeTot(pix, mode='vpa', mask=None):
+    '''
+    Decode the TOT of every hit of a PixArray (one frame or a whole EventBatch)
+    with a gather from the precomputed table. Hits with Hit == 0 or the invalid
+    marker of the layout are dropped; mask can further restrict the selection.
+    '''
+    table = GetTotTable(mode)
+    index = TotIndex(pix)
+    valid = table.Valid[index] & (pix.Hit > 0)
+    if mask is not None:
+        valid &= mask
+    index = index[valid]
+    return TotValues(
+        mask       = valid,
+        PixelIndex = pix.PixelIndex[valid],
+        TOTf       = table.TOTf[index],
+        TOTc       = table.TOTc[index],
+        TOTc_int1  = table.TOTc_int1[index],
+    )
@@ -17,10 +17,29 @@ from common._AltirocSlowControl import *
 from common._AltirocTdcClk      import *
 from common._AltirocTrig        import *
 from common._Dac                import *
+from common._SlaveMonitor       import *
+from common._TotDecoding        import *
+from common._HitFilter          import *
+from common._HitStore           import *
+from common._CsvExport          import *
 from common._DataStreamReader   import *
+from common._ScanStepReader     import *
+from common._AsyncStream        import *
+from common._EventDecoder       import *
+from common._EventBuilder       import *
+from common._DataFileReader     import *
+from common._DataFileIndex      import *
+from common._FrameGenerator     import *
+from common._FebEmulator        import *
+from common._ScanProcessor      import *
+from common._DataIntegrity      import *
+from common._PixelHistogram     import *
+from common._StreamingStats     import *
 from common._Fpga               import *
 from common._Top                import *
 from common._Sem                import *
+from common._LiveAccumulator    import *
+from common._LiveMonitor        import *
 from common._LiveDisplay        import *
 
 def getNsValue(var):
@@ -130,11 +130,33 @@ def set_fpga_for_custom_config(top, pixel_number):
 #################################################################
 
 
-def scan_delay_range(top, delay_range, optimal_HitData):
+def scan_delay_range(top, delay_range):
     weighted_sum = 0
     total_hits = 0
+
+    # Only the final sweep is kept in the TOA statistics
+    if delay_range.step == DelayRange_final_step_size:
+        dataStream.stats.reset()
+
+    # The frames are attributed to the delay value by their TrigCnt, so the next
+    # delay value is issued while the hits of the previous one are still arriving
+    trig = top.Fpga[0].Asic.Trig
+    def collect(delay_value):
+        nonlocal weighted_sum, total_hits
+        step = dataStream.popStep(delay_value, timeout=1.0)
+        HitData = step.HitData
+        weighted_sum += delay_value * len(HitData)
+        total_hits += len(HitData)
+
+        print( '| {:>4} | {:>4} | {:>10} | {:>12} |'.format(
+            delay_value, len(HitData), total_hits, weighted_sum)
+        )
+        #print(HitData)
+
+    previous = None
     for delay_value in delay_range:
         top.Fpga[0].Asic.Gpio.DlyCalPulseSet.set(delay_value)
+        dataStream.beginStep(delay_value, trig.TriggerCnt.get())
 
         for i in range(NofIterationsTOA):
             if (asicVersion == 1):
@@ -144,19 +166,13 @@ def scan_delay_range(top, delay_range, optimal_HitData):
                 top.Fpga[0].Asic.CalPulse.Start()
                 time.sleep(0.001)
 
-        time.sleep(0.1)
+        dataStream.endStep(trig.TriggerCnt.get())
+        if previous is not None:
+            collect(previous)
+        previous = delay_value
 
-        HitData = dataStream.HitData
-        weighted_sum += delay_value * len(HitData)
-        total_hits += len(HitData)
-        if delay_range.step == DelayRange_final_step_size:
-            optimal_HitData.append( HitData.copy() )
-
-        print( '| {:>4} | {:>4} | {:>10} | {:>12} |'.format(
-            delay_value, len(HitData), total_hits, weighted_sum)
-        )
-        #print(HitData)
-        dataStream.HitData.clear()
+    if previous is not None:
+        collect(previous)
 
     #calculate weighted average of hit counts
     if total_hits == 0: return No_hits_error_value
@@ -166,7 +182,7 @@ def scan_delay_range(top, delay_range, optimal_HitData):
 #################################################################
 
 
-def find_optimal_delay_range(top, dataStream, delay_range, optimal_HitData):
+def find_optimal_delay_range(top, dataStream, delay_range):
     #Ensure delay range size is no smaller than specified minimum "DelayRange_final_size".
     #If it is, force step size to final value, and perform final sweep
     delay_range_size = delay_range.stop - delay_range.start
@@ -184,7 +200,7 @@ def find_optimal_delay_range(top, dataStream, delay_range, optimal_HitData):
 
     print( '\nDelay Range = ' + str(delay_range) )
     print( '| step | hits | total_hits | weighted_sum |')
-    weighted_hit_average = scan_delay_range(top, delay_range, optimal_HitData)
+    weighted_hit_average = scan_delay_range(top, delay_range)
     if weighted_hit_average == No_hits_error_value: return No_hits_error_value
 
     #Recursively sweep over smaller delay ranges with smaller step sizes,
@@ -209,7 +225,7 @@ def find_optimal_delay_range(top, dataStream, delay_range, optimal_HitData):
         tighter_delay_range_low = weighted_hit_average - tighter_delay_radius
         tighter_delay_range_high = weighted_hit_average + tighter_delay_radius
         tighter_delay_range = range( tighter_delay_range_low, tighter_delay_range_high, tighter_step)
-        return find_optimal_delay_range(top, dataStream, tighter_delay_range, optimal_HitData)
+        return find_optimal_delay_range(top, dataStream, tighter_delay_range)
 #################################################################
 
 
@@ -222,18 +238,18 @@ def run_pixel_calibration(top, dataStream, pixel_number):
 
     #Determine optimal delay range for pixel
     initial_delay_range = range(DelayRange_initial_low, DelayRange_initial_high, DelayRange_initial_step_size)
-    optimal_HitData = []
-    optimal_delay_range = find_optimal_delay_range(top, dataStream, initial_delay_range, optimal_HitData)
+    optimal_delay_range = find_optimal_delay_range(top, dataStream, initial_delay_range)
     if optimal_delay_range == No_hits_error_value:
         return (No_hits_error_value, 'No hits detected...')
 
-    #Collect statistics about TOA data values
-    DataMean = np.zeros( len(optimal_HitData) )
-    DataStdev = np.zeros( len(optimal_HitData) )
-    for delay_value, HitData_list in enumerate(optimal_HitData):
-        if len(HitData_list) > 0:
-            DataMean[delay_value] = np.mean(HitData_list, dtype=np.float64)
-            DataStdev[delay_value] = math.sqrt(math.pow(np.std(HitData_list, dtype=np.float64),2)+1/12)
+    #Collect statistics about TOA data values (accumulated by the reader during the final sweep)
+    DataMean = np.zeros( len(optimal_delay_range) )
+    DataStdev = np.zeros( len(optimal_delay_range) )
+    for delay_index, delay_value in enumerate(optimal_delay_range):
+        result = dataStream.stats.result(fpga=0, scan=delay_value, quantization=1)
+        if result.count > 0:
+            DataMean[delay_index] = result.mean
+            DataStdev[delay_index] = result.std
 
     # The following calculations ignore points with no data (i.e. Std.Dev = 0)
     nonzero = DataMean != 0
@@ -269,8 +285,8 @@ parser.add_argument(
 # Get the arguments
 args = parser.parse_args()
 
-# Setup root class
-top = feb.Top(ip= args.ip)
+# Setup root class (the decoder blocks the stream rather than dropping frames: no hit is lost)
+top = feb.Top(ip= args.ip, decoderBlocking=True)
 
 # Load the default YAML file
 print(f'Loading {Configuration_LOAD_file} Configuration File...')
@@ -279,14 +295,12 @@ top.LoadConfig(arg = Configuration_LOAD_file)
 if DebugPrint:
     # Tap the streaming data interface (same interface that writes to file)
     debugStream = feb.PrintEventReader()
-    pyrogue.streamTap(top.dataStream[0], debugStream) # Assuming only 1 FPGA
+    top.eventDecoder[0].subscribe(debugStream) # Assuming only 1 FPGA
 
-# Create the data reader streaming interface
-dataReader = top.dataStream[0]
-# Create the Event reader streaming interface
-dataStream = feb.MyPixelReader()
-# Connect the file reader ---> event reader
-pr.streamConnect(dataReader, dataStream)
+# Create the Event reader streaming interface (hits kept per delay value)
+dataStream = feb.ScanStepReader(stats=feb.StreamingStats())
+# Subscribe the event reader to the decoded frames (decoded once for all readers)
+top.eventDecoder[0].subscribe(dataStream)
 
 
 LSB_estimate_array = np.zeros(Number_of_pixels)
@@ -306,4 +320,12 @@ print('------+---------+------------')
 for pixel_number in range(Pixel_range_low, Pixel_range_high, Pixel_iteration):
     print( '   {:<2} | {:<7.3f} | {}'.format(pixel_number, LSB_estimate_array[pixel_number], range_list[pixel_number]) )
 
+# The statistics are only valid if the decoder got every frame
+dropCount = top.EventDecoder[0].DropCount.get()
+if dropCount > 0:
+    print(f'WARNING: {dropCount} frames were dropped by the event decoder, the results above are incomplete')
+
 top.stop()
+if DebugPrint:
+    # Print what the background thread still has queued
+    debugStream.stop()
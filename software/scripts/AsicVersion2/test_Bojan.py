@@ -153,19 +153,19 @@ top = feb.Top(
 if DebugPrint:
     top.Fpga[0].AxiVersion.printStatus()
     # Tap the streaming data interface (same interface that writes to file)
-    dataStream = feb.PrintEventReader()
-    pyrogue.streamTap(top.dataStream[0], dataStream) # Assuming only 1 FPGA
+    debugStream = feb.PrintEventReader()
+    pyrogue.streamTap(top.dataStream[0], debugStream) # Assuming only 1 FPGA
 
 # Data Acquisition for TOA and TOT
 if DataAcqusitionTOA == 1:
     acquire_data(DelayRange_low, DelayRange_high, DelayRange_step, top,
-            top.Fpga[0].Asic.Gpio.DlyCalPulseSet, 'TOA', NofIterationsTOA, dataStream)
+            top.Fpga[0].Asic.Gpio.DlyCalPulseSet, 'TOA', NofIterationsTOA, debugStream)
 
 top.Fpga[0].Asic.Gpio.DlyCalPulseSet.set(DelayValueTOT)
 
 if DataAcqusitionTOT == 1:
     acquire_data(PulserRangeL, PulserRangeH, PulserStep, top,
-            top.Fpga[0].Asic.SlowControl.dac_pulser, 'TOT', NofIterationsTOT, dataStream)
+            top.Fpga[0].Asic.SlowControl.dac_pulser, 'TOT', NofIterationsTOT, debugStream)
 
 #######################
 # Data Processing TOA #
@@ -178,38 +178,31 @@ if nTOA_TOT_Processing == 0:
     DataMean = []
     DataStdev = []
 
-    for delay_value in range(DelayRange_low, DelayRange_high, DelayRange_step):
-        # Create the File reader streaming interface
-        dataReader = rogue.utilities.fileio.StreamReader()
-
-        # Create the Event reader streaming interface
-        dataStream = feb.MyFileReader()
-
-        # Connect the file reader ---> event reader
-        pr.streamConnect(dataReader, dataStream)
-
-        # Open the file
-        dataReader.open('TestData/TOA%d.dat' %delay_value)
-
-        # Close file once everything processed
-        dataReader.closeWait()
+    # Reduce all the delay step files in parallel (FPGA channel 0)
+    dataset = feb.ScanDataset(
+        {delay_value: 'TestData/TOA%d.dat' %delay_value for delay_value in range(DelayRange_low, DelayRange_high, DelayRange_step)},
+        channel  = 0,
+        quantity = 'toa',
+    )
 
+    for result in dataset.process():
+        delay_value = result.key
 
         try:
             print('Processing Data for Delay = %d...' % delay_value)
         except OSError:
             pass
 
-        HitData = dataStream.HitData
+        HitData = result.values().tolist()
 
         exec("%s = %r" % ('HitData%d' %delay_value, HitData))
 
         Delay.append(delay_value)
 
-        HitCnt.append(len(HitData))
-        if len(HitData) > 0:
-            DataMean.append(np.mean(HitData, dtype=np.float64))
-            DataStdev.append(math.sqrt(math.pow(np.std(HitData, dtype=np.float64),2)+1/12))
+        HitCnt.append(result.count())
+        if result.count() > 0:
+            DataMean.append(result.mean())
+            DataStdev.append(result.std(quantization=1))
 
         else:
             DataMean.append(0)
@@ -293,7 +286,7 @@ if nTOA_TOT_Processing == 1:
         dataReader = rogue.utilities.fileio.StreamReader()
 
         # Create the Event reader streaming interface
-        dataStream = MyFileReader()
+        dataStream = feb.MyFileReader()
 
         # Connect the file reader ---> event reader
         pr.streamConnect(dataReader, dataStream)
@@ -314,12 +307,12 @@ if nTOA_TOT_Processing == 1:
             HitDataTOTf = dataStream.HitDataTOTf_vpa
             HitDataTOTc = dataStream.HitDataTOTc_vpa
             HitDataTOTc_int1 = dataStream.HitDataTOTc_int1_vpa
-            HitDataTOTf_cumulative = HitDataTOTf_cumulative + dataStream.HitDataTOTf_vpa
+            HitDataTOTf_cumulative = HitDataTOTf_cumulative + dataStream.HitDataTOTf_vpa.tolist()
         else:
             HitDataTOTf = dataStream.HitDataTOTf_tz
             HitDataTOTc = dataStream.HitDataTOTc_tz
             HitDataTOTc_int1 = dataStream.HitDataTOTc_int1_tz
-            HitDataTOTf_cumulative = HitDataTOTf_cumulative + dataStream.HitDataTOTf_tz
+            HitDataTOTf_cumulative = HitDataTOTf_cumulative + dataStream.HitDataTOTf_tz.tolist()
 
         Pulser.append(i)
 
@@ -351,8 +344,8 @@ if nTOA_TOT_Processing == 1:
         #HitDataTOT = HitDataTOTc
 
         exec("%s = %r" % ('HitDataTOT%d' %i, HitDataTOT))
-        exec("%s = %r" % ('HitDataTOTf%d' %i, HitDataTOTf))
-        exec("%s = %r" % ('HitDataTOTc%d' %i, HitDataTOTc))
+        exec("%s = %r" % ('HitDataTOTf%d' %i, HitDataTOTf.tolist()))
+        exec("%s = %r" % ('HitDataTOTc%d' %i, HitDataTOTc.tolist()))
 
         ValidTOTCnt.append(len(HitDataTOT))
         if len(HitDataTOT) > 0:
@@ -546,4 +539,7 @@ plt.show()
 
 input("Press Enter to continue...")
 top.stop()
+if DebugPrint:
+    # Print what the background thread still has queued
+    debugStream.stop()
 exit()
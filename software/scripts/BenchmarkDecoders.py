@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import numpy as np
+
+import common as feb
+
+import argparse
+import tempfile
+import tracemalloc
+import platform
+import json
+import time
+import sys
+import os
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser()
+
+# Add arguments
+parser.add_argument(
+    "--numFrames",
+    type     = int,
+    required = False,
+    default  = 20000,
+    help     = "Number of synthetic frames per benchmark",
+)
+
+parser.add_argument(
+    "--occupancy",
+    type     = float,
+    required = False,
+    default  = 0.5,
+    help     = "Probability of a pixel to be hit",
+)
+
+parser.add_argument(
+    "--pixReadIteration",
+    type     = int,
+    required = False,
+    default  = 0,
+    help     = "PixReadIteration of the synthetic frames",
+)
+
+parser.add_argument(
+    "--repeat",
+    type     = int,
+    required = False,
+    default  = 3,
+    help     = "Number of timed runs per benchmark (the best one is reported)",
+)
+
+parser.add_argument(
+    "--only",
+    nargs    = '+',
+    required = False,
+    default  = None,
+    help     = "Only run the benchmarks with these names",
+)
+
+parser.add_argument(
+    "--baseline",
+    type     = str,
+    required = False,
+    default  = 'config/benchmark-baseline.json',
+    help     = "Baseline file to compare against (and to write with --saveBaseline), the committed one was taken with the default arguments. "
+               "A baseline taken on another host (or Python/NumPy version) is only advisory",
+)
+
+parser.add_argument(
+    "--saveBaseline",
+    action   = 'store_true',
+    help     = "Store the results as the new baseline",
+)
+
+parser.add_argument(
+    "--tolerance",
+    type     = float,
+    required = False,
+    default  = 0.2,
+    help     = "Allowed relative frames/s drop before a benchmark counts as a regression (same host only)",
+)
+
+# Get the arguments
+args = parser.parse_args()
+
+#################################################################
+
+class Benchmark(object):
+    # setup() builds a fresh consumer, run(consumer) processes all the frames once
+    def __init__(self, name, run, setup=lambda: None, teardown=lambda consumer: None):
+        self.name     = name
+        self.run      = run
+        self.setup    = setup
+        self.teardown = teardown
+
+def feed(reader):
+    for frame in frames:
+        reader._acceptFrame(frame)
+
+def stopReader(reader):
+    reader.stop()
+
+#################################################################
+
+# Synthetic data: frames as rogue-like frame objects, as ParseFrames input and as a data file
+generator = feb.FrameGenerator(occupancy=args.occupancy, pixReadIteration=args.pixReadIteration, toaOverflowRate=0.05, dropRate=0.01, seed=1)
+words, offsets, payloadSize = generator.generate(args.numFrames)
+channels = np.zeros(args.numFrames, dtype=np.uint8)
+frames   = [feb.FrameCopy(bytearray(words[o:o+(p>>2)].tobytes())) for o, p in zip(offsets.tolist(), payloadSize.tolist())]
+events   = [feb.ParseFrame(frame) for frame in frames]
+batch    = feb.ParseFrames(words, offsets, payloadSize, channels)
+numHits  = int(np.count_nonzero(batch.pixArray.Hit))
+numBytes = int(payloadSize.sum())
+
+tmpDir   = tempfile.TemporaryDirectory()
+dataPath = os.path.join(tmpDir.name, 'bench.dat')
+feb.WriteDataFile(dataPath, {0: feb.FrameGenerator(occupancy=args.occupancy, pixReadIteration=args.pixReadIteration, seed=1),
+                             1: feb.FrameGenerator(occupancy=args.occupancy, pixReadIteration=args.pixReadIteration, seed=2)}, args.numFrames//2)
+
+def fanOut():
+    decoder = feb.EventDecoder()
+    decoder.subscribe(feb.HitDataReader())
+    decoder.subscribe(feb.HistogramReader())
+    decoder.subscribe(feb.PrintEventReader(printMode='summary', summaryInterval=1e9, queueSize=args.numFrames))
+    return decoder
+
+def buildEvents(builder):
+    builder.subscribe(lambda event: None)
+    for eventFrame in events:
+        builder.addFragment(0, eventFrame)
+        builder.addFragment(1, eventFrame)
+    builder.flush()
+
+def stopFanOut(decoder):
+    for subscriber in decoder._subscribers:
+        if isinstance(subscriber, feb.PrintEventReader):
+            subscriber.stop()
+
+Benchmarks = [
+    # Decoders
+    Benchmark('ParseFrame',          lambda c: [feb.ParseFrame(frame) for frame in frames]),
+    Benchmark('FrameDecoder',        lambda decoder: [decoder.parse(frame) for frame in frames], feb.FrameDecoder),
+    Benchmark('ParseFrames',         lambda c: feb.ParseFrames(words, offsets, payloadSize, channels)),
+    Benchmark('ReadDataFile',        lambda c: feb.ReadDataFile(dataPath)),
+    Benchmark('DecodeTot',           lambda c: feb.DecodeTot(batch.pixArray, 'vpa')),
+    # Readers
+    Benchmark('PrintEventReader',    feed, lambda: feb.PrintEventReader(printMode='summary', summaryInterval=1e9, queueSize=args.numFrames), stopReader),
+    Benchmark('HitDataReader',       feed, lambda: feb.HitDataReader(stats=feb.StreamingStats())),
+    Benchmark('HistogramReader',     feed, feb.HistogramReader),
+    Benchmark('DataIntegrityReader', lambda reader: (feed(reader), reader.flush()), lambda: feb.DataIntegrityReader(feb.DataIntegrityChecker())),
+    Benchmark('EventDecoder(3)',     feed, fanOut, stopFanOut),
+    # Batch consumers
+    Benchmark('PixelHistograms',     lambda hist: hist.fill(batch.pixArray), feb.PixelHistograms),
+    Benchmark('DataIntegrityCheck',  lambda checker: checker.check(batch), feb.DataIntegrityChecker),
+    Benchmark('CsvExporter',         lambda exporter: (exporter.writeBatch(batch), exporter.close()),
+                                     lambda: feb.CsvExporter(prefix=os.path.join(tmpDir.name, 'bench'))),
+    Benchmark('EventBuilder(2)',     buildEvents, lambda: feb.EventBuilder(channels=[0, 1])),
+]
+
+#################################################################
+
+def measure(bench):
+    # Best wall time of args.repeat runs, then one traced run for the allocated bytes
+    best = None
+    for i in range(args.repeat):
+        consumer = bench.setup()
+        start = time.perf_counter()
+        bench.run(consumer)
+        elapsed = time.perf_counter() - start
+        bench.teardown(consumer)
+        best = elapsed if best is None else min(best, elapsed)
+
+    consumer = bench.setup()
+    tracemalloc.start()
+    bench.run(consumer)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    bench.teardown(consumer)
+
+    return {
+        'frames/s' : args.numFrames/best,
+        'hits/s'   : numHits/best,
+        'MB/s'     : numBytes/best/1e6,
+        'peakBytes': peak,
+    }
+
+# Absolute throughput only compares on the machine (and software) it was measured with
+host = {
+    'node'     : platform.node(),
+    'machine'  : platform.machine(),
+    'processor': platform.processor(),
+    'python'   : platform.python_version(),
+    'numpy'    : np.__version__,
+}
+
+baseline = {'host': {}, 'results': {}}
+if os.path.exists(args.baseline):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+else:
+    print(f'No baseline found at {args.baseline}, run with --saveBaseline to create it')
+sameHost = (baseline['host'] == host)
+if baseline['results'] and not sameHost:
+    print(f'Baseline {args.baseline} was taken on {baseline["host"]}, the comparison is advisory only')
+
+print(f'{args.numFrames} frames, {numHits} hits, {numBytes} bytes (occupancy {args.occupancy}, PixReadIteration {args.pixReadIteration})')
+print('{:<20} {:>12} {:>12} {:>9} {:>12} {:>9}'.format('Benchmark', 'frames/s', 'hits/s', 'MB/s', 'peak bytes', 'baseline'))
+
+results     = {}
+regressions = []
+for bench in Benchmarks:
+    if (args.only is not None) and (bench.name not in args.only):
+        continue
+    result = measure(bench)
+    results[bench.name] = result
+
+    # Relative throughput to the stored baseline
+    ratio = ''
+    if bench.name in baseline['results']:
+        rel   = result['frames/s']/baseline['results'][bench.name]['frames/s']
+        ratio = f'{rel:.2f}x'
+        if rel < 1.0-args.tolerance:
+            regressions.append(bench.name)
+            ratio += ' !'
+    print('{:<20} {:>12.0f} {:>12.0f} {:>9.1f} {:>12} {:>9}'.format(
+        bench.name, result['frames/s'], result['hits/s'], result['MB/s'], result['peakBytes'], ratio))
+
+tmpDir.cleanup()
+
+if args.saveBaseline:
+    # Never mix the results of different hosts in one baseline
+    if not sameHost:
+        baseline = {'host': host, 'results': {}}
+    baseline['results'].update(results)
+    with open(args.baseline, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    print(f'Baseline written to {args.baseline}')
+
+if regressions:
+    print(f'Regressions (more than {100*args.tolerance:.0f}% slower than {args.baseline}): {regressions}')
+    if sameHost:
+        sys.exit(1)
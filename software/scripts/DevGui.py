@@ -19,19 +19,6 @@ import common as feb
 import pyrogue.gui
 # import pyrogue.pydm
 
-import time
-import threading
-
-#################################################################
-
-Keep_display_alive = True
-Live_display_interval = 1
-
-#################################################################
-def runLiveDisplay(event_display,fpga_index):
-    while(Keep_display_alive):
-        event_display.refreshDisplay()
-        time.sleep(Live_display_interval)
 #################################################################
 
 # Set the argument parser
@@ -105,6 +92,15 @@ parser.add_argument(
     help     = "prints the stream data event frames",
 )
 
+parser.add_argument(
+    "--printMode",
+    type     = str,
+    required = False,
+    default  = 'full',
+    choices  = ['sync', 'full', 'summary'],
+    help     = "Sets the --printEvents mode: sync, full (background thread) or summary (per-second rates)",
+)
+
 parser.add_argument(
     "--liveDisplay",
     type     = argBool,
@@ -113,6 +109,14 @@ parser.add_argument(
     help     = "Displays live plots of pixel information",
 )
 
+parser.add_argument(
+    "--liveMonitorPort",
+    type     = int,
+    required = False,
+    default  = 0,
+    help     = "Publishes the live plot histograms on this port for scripts/LiveViewer.py (headless live monitoring), 0 to disable",
+)
+
 parser.add_argument(
     "--asicVersion",
     type     = int,
@@ -165,34 +169,44 @@ top = feb.Top(
 )
 
 # Create the Event reader streaming interface
+eventReader = None
 if (args.printEvents):
-    eventReader = feb.PrintEventReader()
+    eventReader = feb.PrintEventReader(printMode=args.printMode)
 
-    # Connect the file reader to the event reader
-    pr.streamTap(top.dataStream[0], eventReader)
+    # Subscribe the event reader to the decoded frames
+    top.eventDecoder[0].subscribe(eventReader)
 
 # Create Live Display
 live_display_resets = []
+live_display_views  = []
+live_display = None
 if args.liveDisplay:
-    for fpga_index in range( top.numEthDev ):
-        # Create the fifo to ensure there is no back-pressure
-        fifo = rogue.interfaces.stream.Fifo(100, 0, True)
-        # Connect the device reader ---> fifo
-        pr.streamTap(top.dataStream[fpga_index], fifo)
-        # Create the pixelreader streaming interface
-        event_display = feb.onlineEventDisplay(
-                plot_title='FPGA ' + str(fpga_index),
-                submitDir='display_snapshots',
-                font_size=4,
-                fig_size=(10,6),
-                overwrite=True  )
+    # One window for all the FPGAs, refreshed from the GUI thread (live_display.start())
+    live_display = feb.LiveDisplayManager(
+            titles=['FPGA ' + str(fpga_index) for fpga_index in range( top.numEthDev )],
+            submitDir='display_snapshots',
+            font_size=4,
+            fig_size=(10,6),
+            overwrite=True  )
+    for fpga_index, event_display in enumerate( live_display.displays ):
         live_display_resets.append( event_display.reset )
-        # Connect the fifo ---> stream reader
-        pr.streamConnect(fifo, event_display)
-        # Retrieve pixel data streaming object
-        display_thread = threading.Thread( target=runLiveDisplay, args=(event_display,fpga_index,) )
-        display_thread.start()
+        live_display_views.append( event_display.setView )
+        # Subscribe to the decoded frames (decoded off the receive thread, no back-pressure)
+        top.eventDecoder[fpga_index].subscribe(event_display)
+
+# Headless live monitoring: histograms filled here, plotted by scripts/LiveViewer.py
+live_monitor = None
+if args.liveMonitorPort:
+    live_histograms = {}
+    for fpga_index in range( top.numEthDev ):
+        hist = feb.LiveHistograms()
+        live_display_resets.append( hist.reset )
+        live_display_views.append( hist.setView )
+        top.eventDecoder[fpga_index].subscribe(hist)
+        live_histograms['FPGA ' + str(fpga_index)] = hist
+    live_monitor = feb.LivePublisher(live_histograms, port=args.liveMonitorPort)
 top.add_live_display_resets(live_display_resets)
+top.add_live_display_views(live_display_views)
 
 #################
 # Legacy PyQT GUI
@@ -206,6 +220,10 @@ if (args.guiType == 'PyQt'):
     guiTop.addTree(top)
     guiTop.resize(600, 800)
 
+    # Refresh the live display on the Qt main loop
+    if live_display is not None:
+        live_display.start()
+
     # Run gui
     appTop.exec_()
 
@@ -223,6 +241,12 @@ else:
     raise ValueError("Invalid GUI type (%s)" % (args.guiType) )
 
 # Close
-Keep_display_alive = False
+if live_display is not None:
+    live_display.stop()
+if live_monitor is not None:
+    live_monitor.stop()
 top.stop()
+if eventReader is not None:
+    # Print what the background thread still has queued
+    eventReader.stop()
 exit()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+# Software FEB on the simulation ports, e.g.:
+#   python scripts/FebEmulator.py --occupancy 0.2 &
+#   python scripts/DevGui.py --ip simulation
+
+import common as feb
+
+import argparse
+import time
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser()
+
+# Add arguments
+parser.add_argument(
+    "--asicVersion",
+    type     = int,
+    required = False,
+    default  = 2,
+    help     = "ASIC version (sets the slow control shift register size)",
+)
+
+parser.add_argument(
+    "--host",
+    type     = str,
+    required = False,
+    default  = '127.0.0.1',
+    help     = "Address to serve on",
+)
+
+parser.add_argument(
+    "--srpPort",
+    type     = int,
+    required = False,
+    default  = 9000,
+    help     = "SRPv3 port",
+)
+
+parser.add_argument(
+    "--dataPort",
+    type     = int,
+    required = False,
+    default  = 9002,
+    help     = "Data stream port",
+)
+
+parser.add_argument(
+    "--maxRate",
+    type     = float,
+    required = False,
+    default  = 100.0e3,
+    help     = "Maximum trigger rate (Hz)",
+)
+
+parser.add_argument(
+    "--extTrigRate",
+    type     = float,
+    required = False,
+    default  = 1000.0,
+    help     = "External (BNC) trigger rate when EnBncExtTrig is set (Hz)",
+)
+
+parser.add_argument(
+    "--occupancy",
+    type     = float,
+    required = False,
+    default  = 0.5,
+    help     = "Probability of a pixel to be hit",
+)
+
+parser.add_argument(
+    "--dropRate",
+    type     = float,
+    required = False,
+    default  = 0.0,
+    help     = "Probability of a trigger to be dropped",
+)
+
+parser.add_argument(
+    "--seed",
+    type     = int,
+    required = False,
+    default  = None,
+    help     = "Random seed of the generated data",
+)
+
+# Get the arguments
+args = parser.parse_args()
+
+#################################################################
+
+emulator = feb.FebEmulator(
+    generator   = feb.FrameGenerator(occupancy=args.occupancy, dropRate=args.dropRate, seed=args.seed),
+    asicVersion = args.asicVersion,
+    extTrigRate = args.extTrigRate,
+    maxRate     = args.maxRate,
+)
+server = feb.FebEmulatorServer(emulator, host=args.host, srpPort=args.srpPort, dataPort=args.dataPort)
+print(f'FEB emulator serving SRPv3 on {args.host}:{args.srpPort} and data on {args.host}:{args.dataPort}')
+
+try:
+    while True:
+        time.sleep(5)
+        print(f'Frames sent: {emulator.frameCount}')
+except KeyboardInterrupt:
+    pass
+
+server.stop()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'ATLAS ALTIROC DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'ATLAS ALTIROC DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+# Renders the live histograms published by DevGui.py --liveMonitorPort (feb.LivePublisher), e.g.:
+#   python scripts/LiveViewer.py --address tcp://daq-node:9200
+
+import common as feb
+
+import matplotlib.pyplot as plt
+import argparse
+import time
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser()
+
+# Add arguments
+parser.add_argument(
+    "--address",
+    type     = str,
+    required = False,
+    default  = 'tcp://localhost:9200',
+    help     = "Address of the LivePublisher",
+)
+
+parser.add_argument(
+    "--refresh",
+    type     = float,
+    required = False,
+    default  = 0.1,
+    help     = "Minimum time between redraws of a display (seconds)",
+)
+
+parser.add_argument(
+    "--fontSize",
+    type     = int,
+    required = False,
+    default  = 4,
+    help     = "Font size of the displays",
+)
+
+# Get the arguments
+args = parser.parse_args()
+
+#################################################################
+
+subscriber = feb.LiveSubscriber(args.address)
+displays   = {}
+latest     = {}
+print(f'Waiting for live histograms from {args.address}')
+
+try:
+    while True:
+        # Keep only the newest snapshot of every source
+        message = subscriber.receive(timeout=args.refresh)
+        while message is not None:
+            name, header, histograms = message
+            latest[name] = histograms
+            message = subscriber.receive(timeout=0)
+
+        for name, histograms in latest.items():
+            if name not in displays:
+                toa, tot, hits = histograms['toa'], histograms['tot'], histograms['hits']
+                displays[name] = feb.onlineEventDisplay(
+                    plot_title = name,
+                    toa_xbins  = toa.shape[1], toa_ybins = toa.shape[0], toa_yrange = (0, toa.shape[0]-1),
+                    tot_xbins  = tot.shape[1], tot_ybins = tot.shape[0], tot_yrange = (0, tot.shape[0]-1),
+                    xpixels    = hits.shape[1], ypixels = hits.shape[0],
+                    submitDir  = 'display_snapshots',
+                    font_size  = args.fontSize,
+                    fig_size   = (10,6),
+                    overwrite  = True,
+                )
+            displays[name].makeDisplay(histograms['toa'], histograms['tot'], histograms['hits'])
+        latest.clear()
+
+        # Keep the windows responsive
+        plt.pause(0.001)
+except KeyboardInterrupt:
+    pass
+
+subscriber.close()
@@ -32,16 +32,68 @@ parser.add_argument(
     help     = "path to data file",
 )
 
+parser.add_argument(
+    "--csv",
+    type     = str,
+    required = False,
+    default  = 'csv',
+    choices  = ['csv', 'tsv'],
+    help     = "Format of the file dump: csv or tsv",
+)
+
+parser.add_argument(
+    "--csvPrefix",
+    type     = str,
+    required = False,
+    default  = 'fpga',
+    help     = "Dump file name prefix, one file per channel: <prefix><channel>.<csv|tsv>",
+)
+
+parser.add_argument(
+    "--hitsOnly",
+    action   = 'store_true',
+    help     = "Only dump the data words with Hit set",
+)
+
+parser.add_argument(
+    "--noCsv",
+    action   = 'store_true',
+    help     = "Do not dump the file, only print it",
+)
+
+parser.add_argument(
+    "--noPrint",
+    action   = 'store_true',
+    help     = "Do not print the file, only dump it (decoded in chunks, much faster)",
+)
+
 # Get the arguments
 args = parser.parse_args()
 
 #################################################################
 
+# Dump of every data word, one file per channel
+exporter = None
+if not args.noCsv:
+    exporter = feb.CsvExporter(
+        prefix    = args.csvPrefix,
+        delimiter = '\t' if args.csv == 'tsv' else ',',
+        hitsOnly  = args.hitsOnly)
+
+if args.noPrint:
+    # Decode the file in chunks and export each batch in one go
+    if exporter is not None:
+        with exporter:
+            for batches in feb.IterDataFile(args.dataFile):
+                for channel in sorted(batches):
+                    exporter.writeBatch(batches[channel])
+    sys.exit()
+
 # Create the File reader streaming interface
 dataReader = rogue.utilities.fileio.StreamReader()
 
-# Create the Event reader streaming interface
-dataStream = feb.PrintEventReader(cvsDump=True)
+# Create the Event reader streaming interface (prints and dumps every event)
+dataStream = feb.PrintEventReader(exporter=exporter)
 
 # Connect the file reader ---> event reader
 pr.streamConnect(dataReader, dataStream)
@@ -51,3 +103,6 @@ dataReader.open(args.dataFile)
 
 # Close file once everything processed
 dataReader.closeWait()
+dataStream.stop()
+if exporter is not None:
+    exporter.close()